@@ -2,15 +2,21 @@
 from __future__ import annotations
 
 import os
+import json
+import base64
+import bisect
 import datetime as dt
 from typing import Any, Dict, List, Optional
 from pathlib import Path
 from dotenv import load_dotenv
 
-import mysql.connector
-from mysql.connector import pooling
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from storage import get_backend  # noqa: E402
+from search_index import SearchIndex  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
 
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from jose import jwt, JWTError
@@ -90,12 +96,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Pool de conexiones
-db_pool = pooling.MySQLConnectionPool(
-    pool_name="ortomedica_pool",
-    pool_size=5,
-    **DB_CONFIG,
-)
+# Backend de datos (DB_BACKEND=mysql|sqlite, ver storage.py). Con MySQL es un
+# pool de 5 conexiones; con SQLite, el archivo local en modo WAL
+backend = get_backend(DB_CONFIG, pool_name="ortomedica_pool", pool_size=5)
 
 
 # =========================
@@ -132,7 +135,7 @@ def decode_token(token: str) -> dict:
 
 
 def get_conn():
-    return db_pool.get_connection()
+    return backend.connect()
 
 
 def fetch_user_by_email(email: str) -> Optional[Dict[str, Any]]:
@@ -246,6 +249,8 @@ def ingest_status():
         "last_success_at": getattr(ingest_state, "last_success_at", None),
         "last_error_at": getattr(ingest_state, "last_error_at", None),
         "last_error_msg": getattr(ingest_state, "last_error_msg", None),
+        "search_index": search_index.stats(),
+        "products_cache": products_cache.stats(),
     }
 
 # Parche de compatibilidad si tu ingest_state existente no tenía estos atributos:
@@ -286,6 +291,9 @@ def ingest_run():
             ingest_state.status = f"error: {e}"
         finally:
             ingest_state.busy = False
+            products_cache.bump()
+            if SEARCH_INDEX_ON:
+                search_index.rebuild_async()
 
     threading.Thread(target=_worker, daemon=True).start()
     return {"ok": True, "started_at": ingest_state.started_at}
@@ -303,124 +311,362 @@ def _run_ingest_cmd(cmd: str, cwd: str = None):
         ingest_state.status = "error"
     finally:
         ingest_state.busy = False
+        # Catálogo nuevo: invalidar la caché de /products y rearmar el índice
+        # de búsqueda (en segundo plano)
+        products_cache.bump()
+        if SEARCH_INDEX_ON:
+            search_index.rebuild_async()
 
 # =========================
 # PRODUCTS (público)
 # =========================
 
+# /products lee product_summary (una fila por SKU, mantenida por la ingesta) y
+# trae las ofertas de inventory_current solo para los SKUs de la página
+_SUMMARY_SELECT = """
+    SELECT ps.sku, ps.name, ps.image_url, ps.total_stock, ps.min_price, ps.max_price,
+           ps.store_count, ps.updated_at
+    FROM product_summary ps
+"""
+
+# Una fila por oferta (SKU en una bodega), en orden estable
+_OFFERS_SELECT = """
+    SELECT
+        i.sku,
+        i.store_id,
+        s.name              AS store_name,
+        i.costo             AS cost,
+        i.precio            AS price,
+        i.existencia        AS stock,
+        -- La ingesta solo reescribe las filas que cambian: la última vez que se
+        -- vio la tienda está en ingest_export_cache
+        COALESCE(ec.updated_at, i.last_seen_at) AS updated_at
+    FROM inventory_current i
+    LEFT JOIN stores s          ON s.id = i.store_id
+    LEFT JOIN ingest_export_cache ec
+           ON ec.system_code = i.system_code AND ec.store_id = i.store_id
+"""
+_OFFERS_ORDER = "i.sku, i.system_code, i.store_id, i.system_id"
+
+
+# Quién emitió el cursor. El índice en memoria ordena por nombre normalizado
+# (sin tildes ni mayúsculas) y la BD por ORDER BY name, sku: el mismo (name, sku)
+# cae en otro lugar según quién lo lea, así que cada cursor vuelve a su camino
+_CURSOR_DB = "db"
+_CURSOR_INDEX = "idx"
+
+
+def encode_cursor(name: Optional[str], sku: Optional[str], source: str = _CURSOR_DB) -> str:
+    """Token opaco con el último (name, sku) devuelto y el camino que lo dio."""
+    raw = json.dumps([name, sku, source], ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str):
+    """(name, sku, source); los cursores sin source son de la BD."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw.decode("utf-8"))
+        name, sku = data[:2]
+        source = data[2] if len(data) > 2 else _CURSOR_DB
+        if source not in (_CURSOR_DB, _CURSOR_INDEX):
+            raise ValueError(source)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="cursor inválido")
+    return name, sku, source
+
+
+def _iso(u) -> Optional[str]:
+    if isinstance(u, dt.datetime):
+        return u.isoformat()
+    if isinstance(u, str):
+        return u
+    return None
+
+
+def _num(v, cast):
+    return cast(v) if v is not None else None
+
+
+def _summary_item(r: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de product_summary → item de la lista."""
+    return {
+        "sku": r["sku"],
+        "name": r["name"],
+        "brand": None,             # no lo usa la lista
+        "description": None,       # no lo usa la lista
+        "image_url": r.get("image_url"),
+        "total_stock": _num(r["total_stock"], int),
+        "min_price": _num(r["min_price"], float),
+        "max_price": _num(r["max_price"], float),
+        "store_count": r["store_count"],
+        "updated_at": _iso(r.get("updated_at")),
+    }
+
+
+def _fetch_offers(cur, skus: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Todas las ofertas de `skus` en una consulta (IN sobre sku) → {sku: [ofertas]}."""
+    offers: Dict[str, List[Dict[str, Any]]] = {}
+    if not skus:
+        return offers
+    marks = ", ".join(["%s"] * len(skus))
+    cur.execute(f"""
+        {_OFFERS_SELECT}
+        WHERE i.sku IN ({marks})
+        ORDER BY {_OFFERS_ORDER}
+    """, tuple(skus))
+    for r in cur.fetchall():
+        offers.setdefault(r["sku"], []).append({
+            "store_id": r["store_id"],
+            "store_name": r["store_name"],
+            "price": _num(r["price"], float),
+            "cost": _num(r["cost"], float),
+            "stock": _num(r["stock"], int),
+            "updated_at": _iso(r.get("updated_at")),
+        })
+    return offers
+
+
+def _page_items(cur, rows: List[Dict[str, Any]], with_offers: bool) -> List[Dict[str, Any]]:
+    items = [_summary_item(r) for r in rows]
+    if with_offers:
+        offers = _fetch_offers(cur, [it["sku"] for it in items])
+        for it in items:
+            it["offers"] = offers.get(it["sku"], [])
+    return items
+
+
+# =========================
+# BÚSQUEDA EN MEMORIA (search_index.py)
+# =========================
+
+def _load_search_rows():
+    # Todos los nombres de cada SKU (varían entre sistemas y tiendas), no solo
+    # el canónico de product_summary: la búsqueda lo encuentra por cualquiera
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT DISTINCT sku, name FROM inventory_current WHERE sku IS NOT NULL")
+        rows = cur.fetchall()
+        cur.close()
+        return rows
+    finally:
+        conn.close()
+
+
+def _ingest_generation():
+    """
+    (corridas ok, última id ok) de ingestion_runs: generación que comparten
+    search_index y products_cache. El conteo sube con cada ingesta que termina
+    aunque lo haga después de otra con id mayor (MAX(id) solo no se movería);
+    ambos salen del índice idx_runs_status.
+    """
+    conn = get_conn()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), MAX(id) FROM ingestion_runs WHERE status='ok'")
+        row = cur.fetchone()
+        cur.close()
+        return tuple(row) if row else None
+    finally:
+        conn.close()
+
+
+# SEARCH_INDEX=0 deja la búsqueda en la BD (FULLTEXT / FTS5). SEARCH_INDEX_POLL:
+# cada cuántos segundos se mira ingestion_runs por ingestas lanzadas fuera de la API
+search_index = SearchIndex(_load_search_rows, probe=_ingest_generation)
+SEARCH_INDEX_ON = os.getenv("SEARCH_INDEX", "1") != "0"
+
+
+def _products_generation():
+    """
+    Generación del catálogo para products_cache: _ingest_generation (cambia al
+    terminar cada ingesta, también las de cron) y el índice en memoria vigente
+    (las búsquedas cambian cuando se rearma).
+    """
+    return _ingest_generation(), search_index.built_at if SEARCH_INDEX_ON else None
+
+
+# PRODUCTS_CACHE_MB=0 apaga la caché. La generación se consulta como mucho cada
+# PRODUCTS_CACHE_CHECK segundos (y enseguida tras /ingest/run)
+products_cache = ResponseCache(
+    max_bytes=int(float(os.getenv("PRODUCTS_CACHE_MB") or 32) * 1024 * 1024),
+    ttl=float(os.getenv("PRODUCTS_CACHE_TTL") or 300),
+    generation=_products_generation,
+    check_every=float(os.getenv("PRODUCTS_CACHE_CHECK") or 5),
+)
+
+
+@app.on_event("startup")
+def _start_search_index():
+    if SEARCH_INDEX_ON:
+        search_index.rebuild_async()
+        search_index.watch(float(os.getenv("SEARCH_INDEX_POLL") or 60))
+
+
+def _search_products(words: List[str], page: int, page_size: int, cursor: Optional[str],
+                     with_offers: bool):
+    """
+    /products?q= con el índice en memoria: los SKUs que coinciden (y el
+    total) salen del índice; la BD solo trae las filas de product_summary
+    (y las ofertas) de los SKUs de la página.
+    """
+    index = search_index.index
+    docs = index.search(words)
+    if cursor:
+        name, sku, _ = decode_cursor(cursor)
+        start = bisect.bisect_left(docs, index.after(name, sku))
+    else:
+        start = (page - 1) * page_size
+    page_docs = docs[start:start + page_size]
+    skus = [index.skus[d] for d in page_docs]
+    next_cursor = None
+    if start + page_size < len(docs):
+        last = page_docs[-1]
+        next_cursor = encode_cursor(index.names[last], index.skus[last], _CURSOR_INDEX)
+
+    rows: Dict[str, Dict[str, Any]] = {}
+    conn = get_conn()
+    try:
+        cur = conn.cursor(dictionary=True)
+        if skus:
+            cur.execute(f"{_SUMMARY_SELECT} WHERE ps.sku IN ({', '.join(['%s'] * len(skus))})",
+                        tuple(skus))
+            rows = {r["sku"]: r for r in cur.fetchall()}
+        # Orden de la página según el índice; un SKU que ya no está en la BD
+        # (índice de antes de la última ingesta) simplemente no aparece
+        items = _page_items(cur, [rows[sku] for sku in skus if sku in rows], with_offers)
+        cur.close()
+    finally:
+        conn.close()
+    return {
+        "items": items,
+        "page": None if cursor else page,
+        "page_size": page_size,
+        "total": len(docs),
+        "next_cursor": next_cursor,
+    }
+
+
 @app.get("/products")
 def list_products(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
     q: Optional[str] = Query(None, description="Filtro por sku o nombre"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (en vez de page)"),
+    offers: bool = Query(True, description="false = solo el resumen por SKU, sin ofertas por bodega"),
 ):
     """
-    Devuelve productos paginados agrupando por SKU, con sus ofertas (bodegas) en 'offers'.
-    Lee DIRECTO de inventory_current + stores (+ product_assets).
+    Devuelve productos paginados, uno por SKU: el resumen de product_summary
+    (nombre, imagen, stock total, precio mín./máx., bodegas) y sus ofertas
+    (bodegas) en 'offers'.
+
+    La página es una lectura por rango del índice (name, sku) de
+    product_summary; las ofertas de esos SKUs salen después de
+    inventory_current con un IN. Con offers=false la página es solo esa
+    lectura.
+
+    Dos formas de paginar:
+      - page: OFFSET (compatibilidad); cuesta más cuanto más profunda la página.
+      - cursor: keyset sobre (name, sku) desde el next_cursor de la respuesta
+        anterior; cualquier página cuesta lo mismo que la primera. No recalcula
+        el total (total=None): se obtiene con la primera página.
+    Las dos traen next_cursor (None en la última), así que se puede pasar de
+    page a cursor.
+
+    Con q, si el índice en memoria está listo, la búsqueda va por
+    _search_products (sin consultar la BD para encontrar los SKUs). El
+    next_cursor lleva quién lo emitió y se sigue en el mismo camino: los dos
+    no ordenan igual los nombres con tildes o mayúsculas.
+
+    Las respuestas pasan por products_cache (ver _products_generation); el
+    header X-Cache dice si salió de la caché (HIT) o de la BD (MISS).
     """
-    offset = (page - 1) * page_size
+    words = (q or "").split()
+    if not products_cache.enabled:
+        return _query_products(page, page_size, words, cursor, offers)
 
-    where = ""
+    # Misma búsqueda escrita distinto (espacios, mayúsculas) = misma entrada
+    key = (None if cursor else page, page_size, " ".join(words).casefold(), cursor, offers)
+    try:
+        body = products_cache.get(key)
+        generation = products_cache.generation()
+    except Exception as e:
+        # Sin generación (BD caída) no se sabe si la entrada vale: ir directo
+        print(f"⚠️ Caché de /products: sin generación ({e})")
+        return _query_products(page, page_size, words, cursor, offers)
+    if body is not None:
+        return Response(body, media_type="application/json", headers={"X-Cache": "HIT"})
+
+    result = _query_products(page, page_size, words, cursor, offers)
+    body = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    products_cache.put(key, body, generation)
+    return Response(body, media_type="application/json", headers={"X-Cache": "MISS"})
+
+
+def _query_products(page: int, page_size: int, words: List[str], cursor: Optional[str],
+                    offers: bool) -> Dict[str, Any]:
+    """La consulta de list_products, sin caché."""
+    conditions: List[str] = []
     params: Dict[str, Any] = {}
-    if q and q.strip():
-        # Dividir la búsqueda en palabras y buscar cada una
-        words = [w.strip() for w in q.strip().split() if w.strip()]
-        if words:
-            conditions = []
-            for idx, word in enumerate(words):
-                param_name = f"q_like_{idx}"
-                conditions.append(f"(i.sku LIKE %({param_name})s OR i.name LIKE %({param_name})s)")
-                params[param_name] = f"%{word}%"
-            where = "WHERE " + " AND ".join(conditions)
-
-    total_sql = f"""
-        SELECT COUNT(*) AS c
-        FROM (
-            SELECT i.sku
-            FROM inventory_current i
-            {where}
-            GROUP BY i.sku
-        ) t
-    """
-
-    rows_sql = f"""
-        SELECT
-            i.sku,
-            i.name,
-            NULL                AS brand,
-            NULL                AS description,
-            pa.image_url        AS image_url,
-            i.store_id,
-            s.name              AS store_name,
-            i.costo             AS cost,
-            i.precio            AS price,
-            i.existencia        AS stock,
-            i.last_seen_at      AS updated_at
-        FROM inventory_current i
-        LEFT JOIN stores s          ON s.id = i.store_id
-        LEFT JOIN product_assets pa ON pa.sku = i.sku
-        {where}
-        ORDER BY i.name
-        LIMIT %(limit)s OFFSET %(offset)s
-    """
-
+    after = decode_cursor(cursor) if cursor else None
+    source = after[2] if after else None
+    # Búsqueda dividida en palabras: todas deben aparecer en sku o nombre.
+    # Un cursor de la BD sigue en la BD aunque el índice ya esté listo
+    if words and SEARCH_INDEX_ON and search_index.ready and source != _CURSOR_DB:
+        return _search_products(words, page, page_size, cursor, offers)
+    if source == _CURSOR_INDEX:
+        # Cursor del índice en memoria sin índice (o sin q): su orden no es el de la BD
+        raise HTTPException(status_code=400, detail="cursor vencido: volver a la primera página")
+    if words:
+        # Sin índice en memoria (apagado o armándose): FULLTEXT en MySQL, FTS5 en SQLite
+        condition, params = backend.product_search(words, alias="ps")
+        conditions.append(condition)
+
+    page_conditions = list(conditions)
     page_params = dict(params)
-    page_params["limit"] = page_size
-    page_params["offset"] = offset
+    if cursor:
+        page_params["c_name"], page_params["c_sku"] = after[:2]
+        # Desarmado en OR (no como tupla) para que MySQL haga rango sobre el índice
+        page_conditions.append(
+            "(ps.name > %(c_name)s OR (ps.name = %(c_name)s AND ps.sku > %(c_sku)s))")
+        page_params["offset"] = 0
+    else:
+        page_params["offset"] = (page - 1) * page_size
+    # Un SKU de más: dice si hay página siguiente
+    page_params["limit"] = page_size + 1
+
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    page_where = ("WHERE " + " AND ".join(page_conditions)) if page_conditions else ""
 
     conn = get_conn()
     try:
         cur = conn.cursor(dictionary=True)
 
-        # total por SKU distinto
-        cur.execute(total_sql, params)
-        total = int(cur.fetchone()["c"] or 0)
-
-        # filas planas
-        cur.execute(rows_sql, page_params)
-        flat: List[Dict[str, Any]] = cur.fetchall()
-
-        # agrupar por sku
-        products: Dict[str, Dict[str, Any]] = {}
-        for r in flat:
-            sku = r["sku"]
-            if sku not in products:
-                products[sku] = {
-                    "sku": sku,
-                    "name": r["name"],
-                    "brand": r["brand"],             # NULL aquí (no lo usa la lista)
-                    "description": r["description"], # NULL aquí (no lo usa la lista)
-                    "image_url": r.get("image_url"), # opcional
-                    "offers": [],
-                }
-            # transformar tipos
-            price = float(r["price"]) if r["price"] is not None else None
-            cost = float(r["cost"]) if r["cost"] is not None else None
-            stock = int(r["stock"]) if r["stock"] is not None else None
-
-            updated_iso = None
-            u = r.get("updated_at")
-            if isinstance(u, dt.datetime):
-                updated_iso = u.isoformat()
-            elif isinstance(u, str):
-                updated_iso = u
-
-            products[sku]["offers"].append({
-                "store_id": r["store_id"],
-                "store_name": r["store_name"],
-                "price": price,
-                "cost": cost,
-                "stock": stock,
-                "updated_at": updated_iso,
-            })
-
-        items = list(products.values())
+        # total de SKUs (con cursor no: sería un conteo por página)
+        total = None
+        if not cursor:
+            cur.execute(f"SELECT COUNT(*) AS c FROM product_summary ps {where}", params)
+            total = int(cur.fetchone()["c"] or 0)
+
+        cur.execute(f"""
+            {_SUMMARY_SELECT}
+            {page_where}
+            ORDER BY ps.name, ps.sku
+            LIMIT %(limit)s OFFSET %(offset)s
+        """, page_params)
+        rows = cur.fetchall()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            next_cursor = encode_cursor(rows[-1]["name"], rows[-1]["sku"])
 
         return {
-            "items": items,
-            "page": page,
+            "items": _page_items(cur, rows, offers),
+            "page": None if cursor else page,
             "page_size": page_size,
             "total": total,
+            "next_cursor": next_cursor,
         }
     finally:
         try:
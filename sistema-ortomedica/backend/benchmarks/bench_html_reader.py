@@ -0,0 +1,114 @@
+"""
+Benchmark del lector HTML de core_scraper_xls: BeautifulSoup (lector anterior)
+contra el lector incremental de lxml (_iter_html_rows).
+
+Genera un export sintético con el mismo formato que Sistema A/B (HTML con
+extensión .xls) y mide cada lector en un proceso aparte para que el pico de
+memoria (ru_maxrss) de uno no contamine al otro.
+
+Uso (desde backend/):
+    python benchmarks/bench_html_reader.py            # 100k filas
+    python benchmarks/bench_html_reader.py --rows 20000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+HEADERS = ["Id", "Código", "Decripción", "Existencia", "Costo", "PrecioVenta"]
+
+
+def make_export(path: str, rows: int, seed: int = 7):
+    rnd = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><meta charset='utf-8'></head><body>\n<table border='1'>\n<tr>")
+        f.write("".join(f"<th>{h}</th>" for h in HEADERS))
+        f.write("</tr>\n")
+        for i in range(1, rows + 1):
+            costo = rnd.randint(500, 90000)
+            f.write(
+                f"<tr><td>{i}</td><td>SKU-{i:06d}</td>"
+                f"<td>RODILLERA CON SOPORTE LATERAL TALLA {rnd.choice('SMLX')} Nº{i}</td>"
+                f"<td>{rnd.randint(0, 40)}</td><td>{costo:,}.00</td><td>{costo * 2:,}.00</td></tr>\n"
+            )
+        f.write("</table></body></html>\n")
+
+
+def read_bs4(data: bytes):
+    """Copia del lector anterior (BeautifulSoup sobre el texto completo)."""
+    from bs4 import BeautifulSoup
+
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1", errors="ignore")
+    soup = BeautifulSoup(text, "lxml")
+    table = soup.find("table")
+    rows = []
+    for tr in table.find_all("tr"):
+        cells = [c.get_text(strip=True) for c in (tr.find_all("td") or tr.find_all("th"))]
+        if cells:
+            rows.append(cells)
+    return len(rows)
+
+
+def read_lxml(data: bytes):
+    from scrapers.core_scraper_xls import _iter_html_rows
+
+    n = 0
+    for _ in _iter_html_rows(data):
+        n += 1
+    return n
+
+
+def _child(variant: str, path: str):
+    fn = {"bs4": read_bs4, "lxml": read_lxml}[variant]
+    with open(path, "rb") as f:
+        data = f.read()
+    t0 = time.perf_counter()
+    n = fn(data)
+    secs = time.perf_counter() - t0
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rows": n, "secs": secs, "maxrss_mb": rss_kb / 1024}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--child", nargs=2, metavar=("VARIANT", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        _child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reporte.xls")
+        make_export(path, args.rows)
+        size_mb = os.path.getsize(path) / (1 << 20)
+        print(f"Export sintético: {args.rows} filas, {size_mb:.1f} MB")
+
+        results = {}
+        for variant in ("bs4", "lxml"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", variant, path],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+            ).stdout
+            results[variant] = r = json.loads(out.strip().splitlines()[-1])
+            print(f"{variant:5s} filas={r['rows']:>8d}  tiempo={r['secs']:7.2f}s  pico RSS={r['maxrss_mb']:8.1f} MB")
+
+        b, x = results["bs4"], results["lxml"]
+        print(f"\nlxml vs bs4: {b['secs'] / x['secs']:.1f}x más rápido, "
+              f"{b['maxrss_mb'] / x['maxrss_mb']:.1f}x menos memoria pico")
+
+
+if __name__ == "__main__":
+    main()
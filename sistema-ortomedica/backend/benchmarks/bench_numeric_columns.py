@@ -0,0 +1,137 @@
+"""
+Microbenchmark de la conversión numérica: parse_price / to_int_loose celda por
+celda contra parse_price_column / to_int_loose_column por lotes (NumPy).
+
+El corpus sale de los valores reales de costo, precio y existencia del dump
+de inventory_current (BD/inventarios.sql), escritos en los formatos que traen
+los exports: "18750.00", "18,750.00", "18.750,00", "₡18,750.00", números de
+xlrd (float), celdas vacías... Antes de medir se verifica que ambas versiones
+den exactamente el mismo resultado.
+
+Uso (desde backend/):
+    python benchmarks/bench_numeric_columns.py
+    python benchmarks/bench_numeric_columns.py --dump ruta/a/inventarios.sql --chunk 5000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from utils import parse_price, to_int_loose, parse_price_column, to_int_loose_column  # noqa: E402
+
+DEFAULT_DUMP = os.path.join(BACKEND_DIR, "..", "Sistema_Ortomedica_v4", "BD", "inventarios.sql")
+
+ROW_RE = re.compile(
+    r"\('SISTEMA_[AB]',\d+,'(?:[^'\\]|\\.)*','(?:[^'\\]|\\.)*','(?:[^'\\]|\\.)*',"
+    r"(-?\d+|NULL),(-?[\d.]+|NULL),(-?[\d.]+|NULL),"
+)
+
+
+def load_real_values(dump_path: str):
+    existencias, precios = [], []
+    with open(dump_path, encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            if not line.startswith("INSERT INTO `inventory_current`"):
+                continue
+            for e, c, p in ROW_RE.findall(line):
+                if e != "NULL":
+                    existencias.append(int(e))
+                precios += [v for v in (c, p) if v != "NULL"]
+    return existencias, precios
+
+
+def price_variants(v: str):
+    whole, _, dec = v.partition(".")
+    neg = whole.startswith("-")
+    whole = whole.lstrip("-")
+    groups = f"{int(whole):,}"
+    sign = "-" if neg else ""
+    return [
+        v,                                                      # 18750.00
+        f"{sign}{groups}.{dec}",                                # 18,750.00
+        f"{sign}{groups.replace(',', '.')},{dec}",              # 18.750,00
+        f"₡{sign}{groups}.{dec}",                               # ₡18,750.00
+        f"{sign}{whole},{dec}",                                 # 18750,00
+        float(v),                                               # celda numérica de xlrd/openpyxl
+        None,
+        "",
+    ]
+
+
+def int_variants(e: int):
+    return [str(e), f"{e:,}".replace(",", "."), float(e), f" {e} ", None, ""]
+
+
+def build_columns(dump_path: str, size: int, seed: int = 11):
+    if os.path.exists(dump_path):
+        existencias, precios = load_real_values(dump_path)
+        source = f"{len(precios)} precios y {len(existencias)} existencias de {os.path.basename(dump_path)}"
+    else:
+        rnd0 = random.Random(seed)
+        existencias = [rnd0.randint(0, 60) for _ in range(5000)]
+        precios = [f"{rnd0.randint(100, 250000)}.{rnd0.choice(['00', '50', '25'])}" for _ in range(5000)]
+        source = "valores sintéticos (no se encontró el dump)"
+
+    rnd = random.Random(seed)
+    # Cada columna de un export usa un mismo formato; armamos columnas por formato
+    price_cols = []
+    for k in range(len(price_variants("1.00"))):
+        price_cols.append([price_variants(rnd.choice(precios))[k] for _ in range(size)])
+    int_cols = []
+    for k in range(len(int_variants(1))):
+        int_cols.append([int_variants(rnd.choice(existencias))[k] for _ in range(size)])
+    return source, price_cols, int_cols
+
+
+def _same(a, b):
+    return all((x == y and type(x) is type(y)) or (x is None and y is None) for x, y in zip(a, b)) and len(a) == len(b)
+
+
+def bench(fn, cols, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for c in cols:
+            fn(c)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dump", default=DEFAULT_DUMP)
+    ap.add_argument("--chunk", type=int, default=5000, help="celdas por columna (tamaño de lote)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    source, price_cols, int_cols = build_columns(args.dump, args.chunk)
+    print(f"Corpus: {source}")
+
+    for col in price_cols:
+        assert _same(parse_price_column(col), [parse_price(v) for v in col]), "parse_price_column difiere"
+    for col in int_cols:
+        assert _same(to_int_loose_column(col), [to_int_loose(v) for v in col]), "to_int_loose_column difiere"
+    print("Resultados idénticos a parse_price / to_int_loose ✔")
+
+    cells_p = sum(len(c) for c in price_cols)
+    cells_i = sum(len(c) for c in int_cols)
+    rows = [
+        ("parse_price", cells_p,
+         bench(lambda c: [parse_price(v) for v in c], price_cols, args.repeat),
+         bench(parse_price_column, price_cols, args.repeat)),
+        ("to_int_loose", cells_i,
+         bench(lambda c: [to_int_loose(v) for v in c], int_cols, args.repeat),
+         bench(to_int_loose_column, int_cols, args.repeat)),
+    ]
+    print(f"\n{'función':14s} {'celdas':>8s} {'por celda':>11s} {'por lote':>10s} {'speedup':>8s}")
+    for name, cells, t_cell, t_col in rows:
+        print(f"{name:14s} {cells:8d} {t_cell * 1e3:9.1f}ms {t_col * 1e3:8.1f}ms {t_cell / t_col:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
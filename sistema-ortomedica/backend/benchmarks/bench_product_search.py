@@ -0,0 +1,159 @@
+"""
+Benchmark de la búsqueda de /products (parámetro q): latencia p50/p99 del
+filtro con LIKE '%palabra%' (antes), del índice de búsqueda del backend
+(FULLTEXT ngram en MySQL, FTS5 trigram en SQLite) y del índice de trigramas
+en memoria de la API (search_index.py).
+
+Corre sobre la BD del .env (DB_BACKEND), con el catálogo que tenga
+product_summary. Las búsquedas salen del propio catálogo: pedazos de
+nombres (1 a 3 palabras) y de SKUs, más algunas que no encuentran nada. Cada
+búsqueda hace lo mismo que list_products: el conteo de SKUs y la primera
+página (en memoria: los SKUs del índice y sus filas de product_summary con
+un IN). Las ofertas por bodega no se miden: son iguales en las tres. También
+verifica que las variantes devuelvan el mismo total; el índice en memoria
+ignora tildes, así que puede encontrar más que FTS5 en SQLite.
+
+Uso (desde backend/):
+    python benchmarks/bench_product_search.py
+    python benchmarks/bench_product_search.py --queries 300 --page-size 20
+    DB_BACKEND=sqlite python benchmarks/bench_product_search.py
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import db  # noqa: E402
+from storage import StorageBackend  # noqa: E402
+from search_index import TrigramIndex  # noqa: E402
+
+COUNT_SQL = "SELECT COUNT(*) FROM product_summary ps WHERE {cond}"
+PAGE_SQL = """
+    SELECT ps.sku, ps.name, ps.total_stock, ps.min_price, ps.max_price
+    FROM product_summary ps
+    WHERE {cond}
+    ORDER BY ps.name, ps.sku
+    LIMIT %(limit)s
+"""
+SUMMARY_SQL = """
+    SELECT ps.sku, ps.name, ps.total_stock, ps.min_price, ps.max_price
+    FROM product_summary ps
+    WHERE ps.sku IN ({marks})
+"""
+
+
+def _fragment(word: str, rnd: random.Random) -> str:
+    if len(word) <= 4:
+        return word
+    n = rnd.randint(3, min(len(word), 8))
+    start = rnd.randint(0, len(word) - n)
+    return word[start:start + n]
+
+
+def make_queries(cur, n: int, seed: int = 7):
+    rand = "RANDOM()" if db._backend.name == "sqlite" else "RAND()"
+    cur.execute(f"SELECT sku, name FROM product_summary ORDER BY {rand} LIMIT %s", (n,))
+    sample = [(sku or "", name or "") for sku, name in cur.fetchall()]
+    rnd = random.Random(seed)
+    queries = []
+    for sku, name in sample:
+        words = [w for w in name.split() if len(w) >= 2]
+        kind = rnd.random()
+        if kind < 0.2 and sku:
+            queries.append([_fragment(sku, rnd)])
+        elif kind < 0.3:
+            queries.append([_fragment(rnd.choice(words or ["zzz"]), rnd), "qxz"])  # sin resultados
+        elif words:
+            k = min(len(words), rnd.randint(1, 3))
+            queries.append([_fragment(w, rnd) for w in rnd.sample(words, k)])
+    return [q for q in queries if q]
+
+
+def sql_search(cur, search, page_size):
+    def _run(words):
+        cond, params = search(words)
+        cur.execute(COUNT_SQL.format(cond=cond), params)
+        total = int(cur.fetchone()[0])
+        cur.execute(PAGE_SQL.format(cond=cond), dict(params, limit=page_size))
+        cur.fetchall()
+        return total
+    return _run
+
+
+def memory_search(cur, index, page_size):
+    def _run(words):
+        docs = index.search(words)
+        skus = [index.skus[d] for d in docs[:page_size]]
+        if skus:
+            cur.execute(SUMMARY_SQL.format(marks=", ".join(["%s"] * len(skus))), skus)
+            cur.fetchall()
+        return len(docs)
+    return _run
+
+
+def run(fn, queries):
+    times, totals = [], []
+    for words in queries:
+        t0 = time.perf_counter()
+        totals.append(fn(words))
+        times.append(time.perf_counter() - t0)
+    return times, totals
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--page-size", type=int, default=10)
+    args = ap.parse_args()
+
+    db.ensure_tables()
+    backend = db._backend
+    con = db._con()
+    cur = con.cursor()
+    cur.execute("SELECT COUNT(*) FROM product_summary")
+    skus = cur.fetchone()[0]
+    if not skus:
+        print("product_summary está vacío: corre una ingesta antes")
+        return
+    queries = make_queries(cur, args.queries)
+    print(f"Backend {backend.name}: {skus} SKUs, {len(queries)} búsquedas")
+
+    t0 = time.perf_counter()
+    cur.execute("SELECT DISTINCT sku, name FROM inventory_current WHERE sku IS NOT NULL")
+    index = TrigramIndex(cur.fetchall())
+    print(f"Índice en memoria: {len(index)} SKUs en {time.perf_counter() - t0:.2f}s, "
+          f"{index.memory_bytes() / 1e6:.1f} MB")
+
+    variants = (
+        ("LIKE", sql_search(cur, lambda words: StorageBackend.product_search(backend, words), args.page_size)),
+        ("índice", sql_search(cur, lambda words: backend.product_search(words), args.page_size)),
+        ("memoria", memory_search(cur, index, args.page_size)),
+    )
+    results = {}
+    for label, fn in variants:
+        run(fn, queries[:10])  # calentar caché
+        results[label] = run(fn, queries)
+    cur.close(); con.close()
+
+    print(f"{'':8s} {'p50':>9s} {'p99':>9s} {'media':>9s}")
+    for label, (times, _) in results.items():
+        print(f"{label:8s} {pct(times, 50) * 1000:7.2f}ms {pct(times, 99) * 1000:7.2f}ms "
+              f"{statistics.mean(times) * 1000:7.2f}ms")
+    for label in ("índice", "memoria"):
+        diff = [q for q, a, b in zip(queries, results["LIKE"][1], results[label][1]) if a != b]
+        if diff:
+            print(f"⚠️ {label}: {len(diff)} búsquedas con otro total que LIKE, p. ej. {diff[:3]}")
+
+
+if __name__ == "__main__":
+    main()
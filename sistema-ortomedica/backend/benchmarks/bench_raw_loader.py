@@ -0,0 +1,77 @@
+"""
+Benchmark de la carga de inventory_raw: bulk_insert_inventory_raw (INSERT
+multi-fila de InventoryWriter) contra load_inventory_raw (LOAD DATA LOCAL
+INFILE), a 10k, 100k y 1M filas.
+
+Necesita la BD del .env y local_infile=ON en el servidor (si está en OFF,
+load_inventory_raw cae a INSERT y el benchmark lo avisa). Las filas se
+escriben con system_code=BENCH y se borran al final de cada medición.
+
+Uso (desde backend/):
+    python benchmarks/bench_raw_loader.py
+    python benchmarks/bench_raw_loader.py --sizes 10000,100000 --chunk 5000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import db  # noqa: E402
+
+SYSTEM_CODE = "BENCH"
+STORE_ID = 999
+
+
+def make_rows(n: int, seed: int = 5):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(1, n + 1):
+        costo = rnd.randint(500, 90000) + rnd.choice((0, 0.5, 0.25))
+        rows.append(dict(
+            system_code=SYSTEM_CODE,
+            store_id=STORE_ID,
+            system_id=str(i) if i % 50 else f"row-{i}",
+            sku=f"SKU-{i:07d}",
+            name=f"RODILLERA CON SOPORTE LATERAL TALLA {rnd.choice('SMLX')}\tNº{i}",
+            existencia=rnd.randint(0, 40),
+            costo=costo,
+            precio=None if i % 97 == 0 else costo * 2,
+        ))
+    return rows
+
+
+def run(fn, rows, chunk):
+    db.clear_store_inventory(SYSTEM_CODE, STORE_ID)
+    t0 = time.perf_counter()
+    for i in range(0, len(rows), chunk):
+        fn(rows[i:i + chunk])
+    secs = time.perf_counter() - t0
+    db.clear_store_inventory(SYSTEM_CODE, STORE_ID)
+    return secs
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="10000,100000,1000000")
+    ap.add_argument("--chunk", type=int, default=5000, help="filas por llamada (INGEST_CHUNK_SIZE)")
+    args = ap.parse_args()
+
+    db.ensure_tables()
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+
+    print(f"{'filas':>9s} {'INSERT':>12s} {'LOAD DATA':>10s} {'speedup':>8s}")
+    for n in sizes:
+        rows = make_rows(n)
+        t_ins = run(db.bulk_insert_inventory_raw, rows, args.chunk)
+        t_inf = run(db.load_inventory_raw, rows, args.chunk)
+        if db._infile_disabled:
+            print("⚠️ El servidor no permite LOAD DATA LOCAL INFILE: las dos columnas miden INSERT")
+        print(f"{n:9d} {t_ins:11.2f}s {t_inf:9.2f}s {t_ins / t_inf:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
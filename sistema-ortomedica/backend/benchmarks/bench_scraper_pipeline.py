@@ -0,0 +1,137 @@
+"""
+Benchmark del solapamiento descarga/parseo de los scrapers: el flujo anterior
+(descargar → process_spreadsheet en el loop → siguiente bodega) contra
+ExportPipeline (parseo en un pool de procesos + hilo escritor mientras se
+"descarga" la siguiente).
+
+La descarga se simula con asyncio.sleep(--download) y el archivo es un export
+HTML sintético. Por defecto las escrituras van a un sumidero en memoria (no
+hace falta MySQL); con --db se usa la BD del .env (con DB_BACKEND=sqlite, un
+archivo SQLite local: sin servidor).
+
+Uso (desde backend/):
+    python benchmarks/bench_scraper_pipeline.py
+    python benchmarks/bench_scraper_pipeline.py --stores 4 --rows 50000 --download 2
+    DB_BACKEND=sqlite SQLITE_PATH=/tmp/bench.db python benchmarks/bench_scraper_pipeline.py --db
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from scrapers import core_scraper_xls as core  # noqa: E402
+from bench_html_reader import make_export  # noqa: E402
+
+COLMAP = {
+    "system_id":  "Id",
+    "sku":        "Código",
+    "name":       "Decripción",
+    "existencia": "Existencia",
+    "costo":      "Costo",
+    "precio":     "PrecioVenta",
+}
+SYSTEM_CODE = "BENCH"
+
+
+class _MemoryWriter:
+    """Reemplaza a db.InventoryWriter: acepta todo sin tocar MySQL."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def insert_raw(self, rows):
+        return len(rows)
+
+    upsert_current = insert_history = refresh_summary = insert_raw
+
+    def clear_raw(self, *args):
+        return 0
+
+    delete_current = save_export_hash = sweep_current = finish_run = clear_raw
+    history_from_staging = clear_raw
+
+    def summary_skus(self, *args):
+        return set()
+
+    staging_moved_skus = summary_skus
+
+    def commit(self):
+        pass
+
+    def rows_per_sec(self):
+        return 0.0
+
+
+def use_memory_sink():
+    # Solo en este proceso: el escritor corre aquí, los workers no tocan la BD
+    core.InventoryWriter = _MemoryWriter
+    core.begin_ingestion_run = lambda *a: None
+    core.get_export_hash = lambda *a: None
+    core.touch_export_hash = lambda *a: 0
+    core.load_inventory_current = lambda *a: {}
+
+
+async def fake_download(src: str, tmp: str, n: int, secs: float) -> str:
+    await asyncio.sleep(secs)
+    path = os.path.join(tmp, f"reporte-{n}.xls")
+    shutil.copyfile(src, path)
+    return path
+
+
+async def run_sequential(src, tmp, stores, secs):
+    for store_id in range(1, stores + 1):
+        path = await fake_download(src, tmp, store_id, secs)
+        try:
+            core.process_spreadsheet(path, "reporte.xls", SYSTEM_CODE, store_id, COLMAP, force=True)
+        finally:
+            os.remove(path)
+
+
+async def run_pipeline(src, tmp, stores, secs):
+    async with core.ExportPipeline(force=True) as pipeline:
+        for store_id in range(1, stores + 1):
+            path = await fake_download(src, tmp, store_id, secs)
+            pipeline.submit(path, "reporte.xls", SYSTEM_CODE, store_id, COLMAP)
+        await pipeline.results()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--stores", type=int, default=4)
+    ap.add_argument("--rows", type=int, default=50_000)
+    ap.add_argument("--download", type=float, default=2.0, help="segundos simulados por descarga")
+    ap.add_argument("--db", action="store_true", help="escribir en la BD real (.env) en vez de en memoria")
+    args = ap.parse_args()
+
+    if not args.db:
+        use_memory_sink()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "fuente.xls")
+        make_export(src, args.rows)
+
+        only_download = args.stores * args.download
+        print(f"{args.stores} bodegas x {args.rows} filas, descarga simulada de {args.download:.1f}s "
+              f"(solo descargas: {only_download:.1f}s)")
+        for label, fn in (("secuencial", run_sequential), ("pipeline", run_pipeline)):
+            t0 = time.perf_counter()
+            asyncio.run(fn(src, tmp, args.stores, args.download))
+            secs = time.perf_counter() - t0
+            print(f"{label:10s} {secs:6.2f}s  (+{secs - only_download:5.2f}s sobre las descargas)")
+
+
+if __name__ == "__main__":
+    main()
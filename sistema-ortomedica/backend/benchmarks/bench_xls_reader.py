@@ -0,0 +1,129 @@
+"""
+Benchmark del lector BIFF (.xls real) de core_scraper_xls: la versión anterior
+(libro completo + sh.cell_value(rx, cx) celda por celda + lista de listas)
+contra _iter_xls_rows (on_demand, row_values por fila, generador).
+
+El .xls se genera con xlwt (requirements-bench.txt), que escribe BIFF8: el máximo
+es 65 536 filas por hoja. Cada variante corre en un proceso aparte para medir
+su pico de memoria (ru_maxrss); la generación también, porque xlwt arma todo
+el libro en memoria y Linux conserva ru_maxrss a través de fork/exec.
+
+Uso (desde backend/):
+    python benchmarks/bench_xls_reader.py
+    python benchmarks/bench_xls_reader.py --rows 30000 --extra-sheets 3
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import subprocess
+import tempfile
+
+import xlrd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Se importa fuera de la medición para que ambas variantes carguen lo mismo
+from scrapers.core_scraper_xls import _iter_xls_rows  # noqa: E402
+
+HEADERS = ["Id", "Código", "Decripción", "Existencia", "Costo", "PrecioVenta"]
+
+
+def make_xls(path: str, rows: int, extra_sheets: int, seed: int = 7):
+    import xlwt
+
+    rnd = random.Random(seed)
+    wb = xlwt.Workbook(encoding="utf-8")
+    for sx in range(1 + extra_sheets):
+        sh = wb.add_sheet("Reporte" if sx == 0 else f"Hoja{sx + 1}")
+        for c, h in enumerate(HEADERS):
+            sh.write(0, c, h)
+        for r in range(1, rows + 1):
+            costo = rnd.randint(500, 90000)
+            sh.write(r, 0, r)
+            sh.write(r, 1, f"SKU-{r:06d}")
+            sh.write(r, 2, f"RODILLERA CON SOPORTE LATERAL TALLA {rnd.choice('SMLX')}")
+            sh.write(r, 3, rnd.randint(0, 40))
+            sh.write(r, 4, float(costo))
+            sh.write(r, 5, float(costo * 2))
+    wb.save(path)
+
+
+def read_old(data: bytes):
+    """Copia del lector anterior."""
+    book = xlrd.open_workbook(file_contents=data)
+    sh = book.sheet_by_index(0)
+    rows = []
+    for rx in range(sh.nrows):
+        row = []
+        for cx in range(sh.ncols):
+            v = sh.cell_value(rx, cx)
+            row.append(v)
+        rows.append(row)
+    return len(rows)
+
+
+def read_new(data: bytes):
+    n = 0
+    for _ in _iter_xls_rows(data):
+        n += 1
+    return n
+
+
+def _child(variant: str, path: str):
+    fn = {"anterior": read_old, "nuevo": read_new}[variant]
+    with open(path, "rb") as f:
+        data = f.read()
+    t0 = time.perf_counter()
+    n = fn(data)
+    secs = time.perf_counter() - t0
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rows": n, "secs": secs, "maxrss_mb": rss_kb / 1024}))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=65_000, help="filas por hoja (máx. 65535 en BIFF8)")
+    ap.add_argument("--extra-sheets", type=int, default=0,
+                    help="hojas adicionales del mismo tamaño (on_demand no las carga)")
+    ap.add_argument("--make", nargs=3, metavar=("PATH", "ROWS", "EXTRA"), help=argparse.SUPPRESS)
+    ap.add_argument("--child", nargs=2, metavar=("VARIANT", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.make:
+        make_xls(args.make[0], int(args.make[1]), int(args.make[2]))
+        return
+    if args.child:
+        _child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reporte.xls")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--make", path,
+             str(min(args.rows, 65_535)), str(args.extra_sheets)],
+            check=True, cwd=BACKEND_DIR,
+        )
+        size_mb = os.path.getsize(path) / (1 << 20)
+        print(f".xls generado: {args.rows} filas x {1 + args.extra_sheets} hoja(s), {size_mb:.1f} MB")
+
+        results = {}
+        for variant in ("anterior", "nuevo"):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", variant, path],
+                check=True, capture_output=True, text=True, cwd=BACKEND_DIR,
+            ).stdout
+            results[variant] = r = json.loads(out.strip().splitlines()[-1])
+            print(f"{variant:9s} filas={r['rows']:>7d}  tiempo={r['secs']:6.2f}s  pico RSS={r['maxrss_mb']:7.1f} MB")
+
+        a, b = results["anterior"], results["nuevo"]
+        print(f"\nnuevo vs anterior: {a['secs'] / b['secs']:.1f}x más rápido, "
+              f"pico RSS {a['maxrss_mb']:.0f} → {b['maxrss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# compact_raw.py
+"""
+Compacta inventory_raw en inventory_history: de los dumps completos deja solo
+las filas que cambiaron (nuevas, con otro sku/nombre/existencia/costo/precio
+o que dejaron de venir) y borra el dump. Se corre una vez al pasar a
+INGEST_RAW_DUMP=0, o cuando se quiera si el dump sigue activo.
+
+Uso (desde backend/):
+    python compact_raw.py
+    python compact_raw.py --system SISTEMA_A --store 1
+    python compact_raw.py --gap-minutes 30   # minutos sin filas que separan dos dumps
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--system", help="solo este system_code")
+    ap.add_argument("--store", type=int, help="solo esta tienda")
+    ap.add_argument("--gap-minutes", type=float, default=10,
+                    help="minutos entre filas a partir de los cuales empieza otro dump (default 10)")
+    args = ap.parse_args()
+
+    db.ensure_tables()
+    result = db.compact_inventory_raw(args.system, args.store, dump_gap_minutes=args.gap_minutes)
+    if not result:
+        print("inventory_raw está vacío: nada que compactar")
+        return
+    total_read = total_kept = 0
+    for (system_code, store_id), (read, kept) in sorted(result.items()):
+        total_read += read; total_kept += kept
+        print(f"[{system_code}] tienda {store_id}: {read} filas del dump → {kept} al historial")
+    pct = 100.0 * total_kept / total_read if total_read else 0.0
+    print(f"Total: {total_read} → {total_kept} filas ({pct:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
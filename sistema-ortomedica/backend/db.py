@@ -1,11 +1,18 @@
-
 # db.py
 import os
+import time
+import asyncio
+import tempfile
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 from dotenv import load_dotenv
 
+from storage import get_backend
+
 load_dotenv()
 
 CFG = dict(
@@ -17,23 +24,145 @@ CFG = dict(
     port=int(os.getenv("DB_PORT") or "3306"),
 )
 
-def _con():
-    if not CFG["password"]:
-        raise ValueError("⚠️ No hay contraseña en DB_PASS. Agrega DB_PASS=tu_contraseña en backend/.env")
+# DB_BACKEND=mysql (default) o sqlite (ver storage.py). Con SQLite las
+# sentencias que cambian de dialecto salen de _backend.sql (ver _q)
+_backend = get_backend(CFG)
+
+def _q(name: str, sql: str) -> str:
+    # La sentencia en el dialecto del backend activo (sql es la de MySQL)
+    return _backend.sql.get(name, sql)
+
+# Pool de conexiones del proceso (scrapers/ingesta). Cada _con() toma una del
+# pool y con.close() la devuelve, en vez de abrir un TCP+auth nuevo por llamada
+# (en GitHub Actions va por un túnel SSH: cada connect cuesta decenas de ms).
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE") or 4)
+# Segundos que se espera una conexión libre si el pool está agotado
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT") or 30)
+
+_pool = None
+_pool_lock = threading.RLock()
+# Contadores del proceso: conexiones físicas abiertas y préstamos del pool
+_conn_stats = dict(connects=0, reconnects=0, checkouts=0)
+
+def _count(key: str, n: int = 1):
+    with _pool_lock:
+        _conn_stats[key] += n
+
+def connection_stats() -> dict:
+    """Copia de los contadores (connects, reconnects, checkouts) del proceso."""
+    with _pool_lock:
+        return dict(_conn_stats)
+
+def _connect(**extra):
     try:
-        return mysql.connector.connect(**CFG)
+        con = mysql.connector.connect(**CFG, **extra)
     except mysql.connector.Error as e:
         if e.errno == 1045:  # Access denied
             raise ValueError(f"⚠️ MySQL rechazó el usuario {CFG['user']!r}. Verifica DB_USER y DB_PASS en backend/.env") from e
         if e.errno == 2003:  # Can't connect
             raise ValueError("⚠️ No pude conectar a MySQL. ¿El servicio está corriendo en {CFG['host']}:{CFG['port']}?") from e
         raise
+    _count("connects")
+    return con
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # El pool abre sus POOL_SIZE conexiones al crearse
+            try:
+                _pool = pooling.MySQLConnectionPool(pool_name="ortomedica_ingest", pool_size=POOL_SIZE,
+                                                    pool_reset_session=True, **CFG)
+            except mysql.connector.Error:
+                # Sin pool (p. ej. credenciales malas): _connect da el mensaje claro
+                _connect().close()
+                raise
+            _conn_stats["connects"] += POOL_SIZE
+        return _pool
+
+def _con(**extra):
+    """
+    Conexión del pool, verificada con un ping antes de entregarla (si el
+    servidor o el túnel la cortaron, se reconecta). Los argumentos extra de
+    conexión (p. ej. allow_local_infile_in_path) no se pueden dar a una
+    conexión del pool: en ese caso se abre una directa.
+    Con DB_BACKEND=sqlite es una conexión nueva al archivo.
+    """
+    if _backend.name != "mysql":
+        _count("connects"); _count("checkouts")
+        return _backend.connect()
+    if not CFG["password"]:
+        raise ValueError("⚠️ No hay contraseña en DB_PASS. Agrega DB_PASS=tu_contraseña en backend/.env")
+    if extra:
+        return _connect(**extra)
+
+    pool = _get_pool()
+    deadline = time.monotonic() + POOL_TIMEOUT
+    while True:
+        try:
+            con = pool.get_connection()
+            break
+        except pooling.PoolError:
+            # Agotado: esperar a que otro hilo devuelva una
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    _count("checkouts")
+
+    # Pre-ping: una conexión muerta se reabre antes de usarla
+    before = con.connection_id
+    con.ping(reconnect=True, attempts=3, delay=1)
+    if con.connection_id != before:
+        _count("reconnects")
+        _count("connects")
+    return con
+
+def _ensure_column(cur, table: str, column: str, ddl: str) -> bool:
+    # True si la columna no estaba y se agregó
+    cur.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+         WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND COLUMN_NAME=%s
+    """, (table, column))
+    if cur.fetchone() is not None:
+        return False
+    cur.execute(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+    return True
+
+def _ensure_index(cur, table: str, name: str, cols: str, kind: str = "INDEX"):
+    cur.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+         WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s LIMIT 1
+    """, (table, name))
+    if cur.fetchone() is None:
+        cur.execute(f"ALTER TABLE {table} ADD {kind} {name} {cols}")
+
+def _drop_index(cur, table: str, name: str):
+    cur.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+         WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s LIMIT 1
+    """, (table, name))
+    if cur.fetchone() is not None:
+        cur.execute(f"ALTER TABLE {table} DROP INDEX {name}")
+
+def _ensure_product_summary(cur):
+    # Tabla recién creada (o BD de antes de product_summary) con inventario: armarla completa
+    cur.execute("SELECT 1 FROM product_summary LIMIT 1")
+    if cur.fetchone() is None:
+        cur.execute("SELECT 1 FROM inventory_current LIMIT 1")
+        if cur.fetchone() is not None:
+            _upsert_summary(cur)
 
 # ---------------------------------------------------------------------
 # Bootstrap de tablas
 # ---------------------------------------------------------------------
 def ensure_tables():
     con = _con(); cur = con.cursor()
+    if _backend.ensure_schema(cur):
+        # SQLite: mismo esquema, definido en storage.SQLITE_SCHEMA
+        _ensure_product_summary(cur)
+        con.commit()
+        cur.close(); con.close()
+        return
     stmts = [
         # Usuarios y autenticación
         """
@@ -52,7 +181,8 @@ def ensure_tables():
           name VARCHAR(200) NOT NULL
         )
         """,
-        # Dump crudo de cada corrida (permite auditoría)
+        # Dump crudo de cada corrida (solo con INGEST_RAW_DUMP=1; la auditoría
+        # normal va en inventory_history)
         """
         CREATE TABLE IF NOT EXISTS inventory_raw (
           id BIGINT AUTO_INCREMENT PRIMARY KEY,
@@ -82,14 +212,118 @@ def ensure_tables():
           costo DECIMAL(16,2) NULL,
           precio DECIMAL(16,2) NULL,
           last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          run_id BIGINT NOT NULL DEFAULT 0,
           PRIMARY KEY (system_code, store_id, system_id),
           KEY (sku),
-          KEY (name(100))
+          KEY idx_current_run (system_code, store_id, run_id)
+        )
+        """,
+        # Una fila por SKU con lo que muestra /products, mantenida por la ingesta
+        # (InventoryWriter.refresh_summary) con los SKUs que tocó cada corrida.
+        # name es el nombre canónico (el menor entre sistemas/tiendas); names,
+        # todos los nombres distintos del SKU, es lo que busca el FULLTEXT
+        """
+        CREATE TABLE IF NOT EXISTS product_summary (
+          sku VARCHAR(100) NOT NULL PRIMARY KEY,
+          name VARCHAR(500) NOT NULL DEFAULT '',
+          names TEXT NULL,
+          image_url VARCHAR(1000) NULL,
+          total_stock INT NULL,
+          min_price DECIMAL(16,2) NULL,
+          max_price DECIMAL(16,2) NULL,
+          store_count INT NOT NULL DEFAULT 0,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          KEY idx_summary_name_sku (name, sku),
+          FULLTEXT KEY ft_summary_sku_names (sku, names) WITH PARSER ngram
+        )
+        """,
+        # Bitácora de cambios: solo filas nuevas, cambiadas o que dejaron de venir
+        # en el export, con la corrida que lo detectó
+        """
+        CREATE TABLE IF NOT EXISTS inventory_history (
+          id BIGINT AUTO_INCREMENT PRIMARY KEY,
+          run_id BIGINT NOT NULL,
+          system_code VARCHAR(40) NOT NULL,
+          store_id INT NOT NULL,
+          system_id VARCHAR(100) NOT NULL,
+          sku VARCHAR(100) NULL,
+          name VARCHAR(500) NULL,
+          existencia INT NULL,
+          costo DECIMAL(16,2) NULL,
+          precio DECIMAL(16,2) NULL,
+          change_type VARCHAR(10) NOT NULL,
+          recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          KEY (system_code, store_id, system_id, id),
+          KEY (run_id)
+        )
+        """,
+        # Una fila por corrida de ingesta (sistema + tienda). inventory_current.run_id
+        # apunta a la última corrida que escribió cada fila; en full el barrido
+        # borra las de corridas viejas
+        """
+        CREATE TABLE IF NOT EXISTS ingestion_runs (
+          id BIGINT AUTO_INCREMENT PRIMARY KEY,
+          system_code VARCHAR(40) NOT NULL,
+          store_id INT NOT NULL,
+          mode VARCHAR(20) NULL,
+          content_hash CHAR(64) NULL,
+          status VARCHAR(20) NOT NULL DEFAULT 'running',
+          row_count INT NULL,
+          swept INT NULL,
+          error VARCHAR(1000) NULL,
+          started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+          finished_at TIMESTAMP NULL,
+          KEY (system_code, store_id, id),
+          KEY idx_runs_status (status, id)
+        )
+        """,
+        # Staging del modo INGEST_MODE=staging: el export nuevo se carga aquí y
+        # luego se publica en inventory_current con una transacción corta
+        """
+        CREATE TABLE IF NOT EXISTS inventory_current_staging (
+          system_code VARCHAR(40) NOT NULL,
+          store_id INT NOT NULL,
+          system_id VARCHAR(100) NOT NULL,
+          sku VARCHAR(100) NULL,
+          name VARCHAR(500) NULL,
+          existencia INT NULL,
+          costo DECIMAL(16,2) NULL,
+          precio DECIMAL(16,2) NULL,
+          PRIMARY KEY (system_code, store_id, system_id)
+        )
+        """,
+        # Hash del último export ingerido por (system_code, store_id)
+        """
+        CREATE TABLE IF NOT EXISTS ingest_export_cache (
+          system_code VARCHAR(40) NOT NULL,
+          store_id INT NOT NULL,
+          content_hash CHAR(64) NOT NULL,
+          row_count INT NOT NULL DEFAULT 0,
+          updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          PRIMARY KEY (system_code, store_id)
         )
         """
     ]
+    # El índice FULLTEXT se arma sin stopwords: con ngram, cualquier n-grama que
+    # contenga una ("a", "de", ...) quedaría fuera y no se encontrarían esos nombres
+    cur.execute("SET SESSION innodb_ft_enable_stopword = OFF")
     for s in stmts:
         cur.execute(s)
+    # Tablas creadas antes de ingestion_runs: agregar la columna y el índice
+    _ensure_column(cur, "inventory_current", "run_id", "run_id BIGINT NOT NULL DEFAULT 0")
+    _ensure_index(cur, "inventory_current", "idx_current_run", "(system_code, store_id, run_id)")
+    # Generación del catálogo para la API (última corrida ok): MAX(id) por índice
+    _ensure_index(cur, "ingestion_runs", "idx_runs_status", "(status, id)")
+    # El orden, el keyset y la búsqueda de /products pasaron a product_summary
+    _drop_index(cur, "inventory_current", "idx_current_name_sku")
+    _drop_index(cur, "inventory_current", "ft_current_sku_name")
+    # product_summary de antes de names: se vacía y _ensure_product_summary la
+    # vuelve a armar completa; la búsqueda pasa de name a names
+    if _ensure_column(cur, "product_summary", "names", "names TEXT NULL AFTER name"):
+        cur.execute("DELETE FROM product_summary")
+    _drop_index(cur, "product_summary", "ft_summary_sku_name")
+    _ensure_index(cur, "product_summary", "ft_summary_sku_names", "(sku, names) WITH PARSER ngram", "FULLTEXT INDEX")
+    _ensure_product_summary(cur)
     con.commit()
     cur.close(); con.close()
 
@@ -98,7 +332,7 @@ def ensure_tables():
 # ---------------------------------------------------------------------
 def ensure_store(store_id: int, name: str):
     con = _con(); cur = con.cursor()
-    cur.execute("INSERT IGNORE INTO stores (id, name) VALUES (%s, %s)", (store_id, name))
+    cur.execute(_q("ENSURE_STORE", "INSERT IGNORE INTO stores (id, name) VALUES (%s, %s)"), (store_id, name))
     con.commit()
     cur.close(); con.close()
 
@@ -106,6 +340,13 @@ def ensure_store(store_id: int, name: str):
 # ---------------------------------------------------------------------
 # Escribe/actualiza datos
 # ---------------------------------------------------------------------
+def _round_money(row: dict) -> dict:
+    # Con backend.money (SQLite) costo/precio van redondeados como DECIMAL(16,2)
+    money = _backend.money
+    if not money:
+        return row
+    return dict(row, **{c: money(row.get(c)) for c in _MONEY_COLS})
+
 def upsert_inventory_raw(row: dict):
     """
     row = {
@@ -120,7 +361,7 @@ def upsert_inventory_raw(row: dict):
         VALUES
           (%(system_code)s, %(store_id)s, %(system_id)s, %(sku)s, %(name)s,
            %(existencia)s, %(costo)s, %(precio)s)
-    """, row)
+    """, _round_money(row))
     con.commit()
     cur.close(); con.close()
 
@@ -133,7 +374,7 @@ def upsert_inventory_current(row: dict):
     """
     seen_at = row.get("seen_at")
     con = _con(); cur = con.cursor()
-    cur.execute("""
+    cur.execute(_q("UPSERT_INVENTORY_CURRENT", """
         INSERT INTO inventory_current
           (system_code, store_id, system_id, sku, name, existencia, costo, precio, last_seen_at)
         VALUES
@@ -146,70 +387,537 @@ def upsert_inventory_current(row: dict):
            costo=VALUES(costo),
            precio=VALUES(precio),
            last_seen_at=VALUES(last_seen_at)
-    """, row)
+    """), _round_money(row))
     con.commit()
     cur.close(); con.close()
 
 # ------------- OPTIMIZACIONES BULK (menos conexiones) -------------
-def bulk_insert_inventory_raw(rows):
-        """
-        Inserta muchas filas en inventory_raw en una sola conexión.
+_RAW_COLS = ("system_code", "store_id", "system_id", "sku", "name", "existencia", "costo", "precio")
+_CURRENT_COLS = _RAW_COLS + ("seen_at", "run_id")
+# DECIMAL(16,2): con backend.money se redondean antes de guardarlos
+_MONEY_COLS = frozenset(("costo", "precio"))
+
+_INSERT_RAW = """
+    INSERT INTO inventory_raw
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio)
+    VALUES {values}
+"""
+_RAW_VALUES = "(%s, %s, %s, %s, %s, %s, %s, %s)"
+
+_UPSERT_CURRENT = """
+    INSERT INTO inventory_current
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio, last_seen_at, run_id)
+    VALUES {values}
+    ON DUPLICATE KEY UPDATE
+         sku=VALUES(sku),
+         name=VALUES(name),
+         existencia=VALUES(existencia),
+         costo=VALUES(costo),
+         precio=VALUES(precio),
+         last_seen_at=VALUES(last_seen_at),
+         run_id=VALUES(run_id)
+"""
+_CURRENT_VALUES = "(%s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s)"
+
+# Staging: sin last_seen_at; una fila repetida en el export gana la última (igual que en inventory_current)
+_UPSERT_STAGING = """
+    INSERT INTO inventory_current_staging
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio)
+    VALUES {values}
+    ON DUPLICATE KEY UPDATE
+         sku=VALUES(sku),
+         name=VALUES(name),
+         existencia=VALUES(existencia),
+         costo=VALUES(costo),
+         precio=VALUES(precio)
+"""
+
+# Publicación del staging de una tienda/sistema en inventory_current. Solo se
+# tocan las filas que difieren (<=> compara NULL como valor), así la
+# transacción dura lo que el cambio real y no lo que el export completo.
+_PUBLISH_DELETE = """
+    DELETE c FROM inventory_current c
+      LEFT JOIN inventory_current_staging s
+        ON s.system_code=c.system_code AND s.store_id=c.store_id AND s.system_id=c.system_id
+     WHERE c.system_code=%s AND c.store_id=%s AND s.system_id IS NULL
+"""
+_PUBLISH_UPDATE = """
+    UPDATE inventory_current c
+      JOIN inventory_current_staging s
+        ON s.system_code=c.system_code AND s.store_id=c.store_id AND s.system_id=c.system_id
+       SET c.sku=s.sku, c.name=s.name, c.existencia=s.existencia, c.costo=s.costo, c.precio=s.precio,
+           c.run_id=%s
+     WHERE c.system_code=%s AND c.store_id=%s
+       AND NOT (c.sku <=> s.sku AND c.name <=> s.name AND c.existencia <=> s.existencia
+                AND c.costo <=> s.costo AND c.precio <=> s.precio)
+"""
+_PUBLISH_INSERT = """
+    INSERT INTO inventory_current
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio, run_id)
+    SELECT s.system_code, s.store_id, s.system_id, s.sku, s.name, s.existencia, s.costo, s.precio, %s
+      FROM inventory_current_staging s
+      LEFT JOIN inventory_current c
+        ON c.system_code=s.system_code AND c.store_id=s.store_id AND c.system_id=s.system_id
+     WHERE s.system_code=%s AND s.store_id=%s AND c.system_id IS NULL
+"""
+
+# inventory_history: change_type es 'new', 'changed' o 'deleted'
+_HISTORY_COLS = _RAW_COLS + ("change_type", "recorded_at", "run_id")
+_INSERT_HISTORY = """
+    INSERT INTO inventory_history
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio, change_type, recorded_at, run_id)
+    VALUES {values}
+"""
+_HISTORY_VALUES = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s)"
+
+# Cambios del staging contra inventory_current, antes de publicarlo (mismo criterio que _PUBLISH_*)
+_HISTORY_FROM_STAGING = """
+    INSERT INTO inventory_history
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio, change_type, run_id)
+    SELECT s.system_code, s.store_id, s.system_id, s.sku, s.name, s.existencia, s.costo, s.precio,
+           IF(c.system_id IS NULL, 'new', 'changed'), %s
+      FROM inventory_current_staging s
+      LEFT JOIN inventory_current c
+        ON c.system_code=s.system_code AND c.store_id=s.store_id AND c.system_id=s.system_id
+     WHERE s.system_code=%s AND s.store_id=%s
+       AND (c.system_id IS NULL
+            OR NOT (c.sku <=> s.sku AND c.name <=> s.name AND c.existencia <=> s.existencia
+                    AND c.costo <=> s.costo AND c.precio <=> s.precio))
+"""
+_HISTORY_DELETED_FROM_STAGING = """
+    INSERT INTO inventory_history
+        (system_code, store_id, system_id, sku, name, existencia, costo, precio, change_type, run_id)
+    SELECT c.system_code, c.store_id, c.system_id, c.sku, c.name, c.existencia, c.costo, c.precio,
+           'deleted', %s
+      FROM inventory_current c
+      LEFT JOIN inventory_current_staging s
+        ON s.system_code=c.system_code AND s.store_id=c.store_id AND s.system_id=c.system_id
+     WHERE c.system_code=%s AND c.store_id=%s AND s.system_id IS NULL
+"""
+
+# product_summary: se recalcula por SKU desde inventory_current (todas las
+# tiendas/sistemas). names lleva todos los nombres distintos, uno por línea:
+# la búsqueda encuentra el SKU por cualquiera de ellos, no solo por el canónico.
+# updated_at es la última vez que cambió algo del SKU
+_UPSERT_SUMMARY = """
+    INSERT INTO product_summary
+        (sku, name, names, image_url, total_stock, min_price, max_price, store_count, updated_at)
+    SELECT i.sku, COALESCE(MIN(i.name), ''), GROUP_CONCAT(DISTINCT i.name ORDER BY i.name SEPARATOR '\\n'),
+           MAX(pa.image_url), SUM(i.existencia),
+           MIN(i.precio), MAX(i.precio), COUNT(DISTINCT i.store_id), CURRENT_TIMESTAMP
+      FROM inventory_current i
+      LEFT JOIN product_assets pa ON pa.sku = i.sku
+     WHERE i.sku IS NOT NULL {where}
+     GROUP BY i.sku
+    ON DUPLICATE KEY UPDATE
+         name=VALUES(name),
+         names=VALUES(names),
+         image_url=VALUES(image_url),
+         total_stock=VALUES(total_stock),
+         min_price=VALUES(min_price),
+         max_price=VALUES(max_price),
+         store_count=VALUES(store_count),
+         updated_at=VALUES(updated_at)
+"""
+def _upsert_summary(cur, where: str = "", params=()):
+    if _backend.name == "mysql":
+        # GROUP_CONCAT corta en 1024 bytes por defecto: names quedaría incompleto
+        cur.execute("SET SESSION group_concat_max_len = 1048576")
+    cur.execute(_q("UPSERT_SUMMARY", _UPSERT_SUMMARY).format(where=where), params)
+
+# SKUs que ya no tienen ninguna fila en inventory_current
+_DELETE_EMPTY_SUMMARY = """
+    DELETE FROM product_summary
+     WHERE sku IN ({marks})
+       AND NOT EXISTS (SELECT 1 FROM inventory_current i WHERE i.sku = product_summary.sku)
+"""
+
+# Filas por INSERT multi-fila (INGEST_DB_BATCH en .env); además se corta por max_allowed_packet
+DEFAULT_DB_BATCH = 1000
+
+# LOAD DATA LOCAL INFILE: el archivo temporal vive en una carpeta propia y la
+# conexión solo puede leer de ahí (allow_local_infile_in_path)
+_INFILE_DIR = None
+# Errores que indican LOCAL INFILE deshabilitado (servidor o cliente)
+_INFILE_DISABLED_ERRNOS = {1148, 2068, 3948}
+_infile_disabled = False
+
+def _infile_field(v) -> str:
+    if v is None:
+        return "\\N"
+    if isinstance(v, str):
+        return (v.replace("\\", "\\\\").replace("\t", "\\t")
+                 .replace("\n", "\\n").replace("\r", "\\r"))
+    return repr(v) if isinstance(v, float) else str(v)
+
+def _infile_dir() -> str:
+    global _INFILE_DIR
+    if _INFILE_DIR is None:
+        _INFILE_DIR = tempfile.mkdtemp(prefix="ortomedica-infile-")
+    return _INFILE_DIR
+
+def _row_bytes(values) -> int:
+    # Cota del tamaño de la fila en la sentencia: los textos pueden duplicarse al escaparse
+    return sum(2 * len(v) + 4 if isinstance(v, str) else 24 for v in values)
+
+_max_packet = None
+
+def _max_allowed_packet(cur) -> int:
+    # Es global del servidor: se consulta una vez por proceso
+    global _max_packet
+    if _max_packet is None:
+        _max_packet = int(_backend.max_statement_bytes(cur))
+    return _max_packet
+
+class InventoryWriter:
+    """
+    Escritor de una ingesta: UNA conexión para toda la tienda/sistema y UNA
+    transacción para ambas tablas (inventory_raw e inventory_current, más los
+    borrados del modo delta y el hash del export). Si algo falla a mitad de
+    camino no queda nada a medias: se hace rollback al salir del with.
+
+        with InventoryWriter() as w:
+            w.clear_raw(system_code, store_id)
+            w.insert_raw(raw_rows)
+            w.upsert_current(current_rows)
+        # commit al salir sin error
+
+    Las filas se mandan en INSERT multi-fila de hasta `batch` filas (o
+    INGEST_DB_BATCH), cortando antes si la sentencia se acercaría a
+    max_allowed_packet. Cada sentencia queda en `stats` como
+    (tabla, filas, segundos); `on_chunk(tabla, filas, segundos)` se llama
+    después de cada una (para ver filas/s por lote).
+
+    Con raw_loader="infile" inventory_raw se carga con LOAD DATA LOCAL INFILE
+    (si el servidor no lo permite, vuelve a INSERT multi-fila).
+    """
+
+    def __init__(self, batch: int = None, raw_loader: str = "insert", on_chunk=None, run_id: int = 0):
+        # Corrida (ingestion_runs.id) con la que se marcan las filas de inventory_current
+        self.run_id = run_id
+        self.batch = batch or int(os.getenv("INGEST_DB_BATCH") or DEFAULT_DB_BATCH)
+        # LOAD DATA es de MySQL: con otro backend siempre INSERT multi-fila
+        self.raw_loader = raw_loader if _backend.supports_infile else "insert"
+        self.on_chunk = on_chunk
+        self.stats = []
+        extra = dict(allow_local_infile_in_path=_infile_dir()) if self.raw_loader == "infile" else {}
+        self.con = _con(**extra)
+        self.cur = self.con.cursor()
+        # Margen para el texto fijo de la sentencia y el encabezado del paquete
+        self.max_bytes = _max_allowed_packet(self.cur) - 64 * 1024
+        # autocommit está apagado: todo hasta commit() es una sola transacción
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.con.rollback()
+        finally:
+            self.close()
+
+    def commit(self):
+        self.con.commit()
+
+    def close(self):
+        self.cur.close(); self.con.close()
+
+    def _record(self, table: str, rows: int, secs: float):
+        self.stats.append((table, rows, secs))
+        if self.on_chunk:
+            self.on_chunk(table, rows, secs)
+
+    def _insert_many(self, table: str, sql: str, values_sql: str, cols, rows) -> int:
+        n = 0
+        part, params, size = [], [], 0
+        # Además del lote, el tope de parámetros por sentencia del backend
+        batch = min(self.batch, _backend.max_params() // len(cols))
+        money = _backend.money
+        for r in rows:
+            vals = [self.run_id if c == "run_id" else r.get(c) for c in cols]
+            if money:
+                vals = [money(v) if c in _MONEY_COLS else v for c, v in zip(cols, vals)]
+            b = _row_bytes(vals)
+            if part and (len(part) >= batch or size + b > self.max_bytes):
+                n += self._execute_chunk(table, sql, values_sql, part, params)
+                part, params, size = [], [], 0
+            part.append(r)
+            params.extend(vals)
+            size += b
+        if part:
+            n += self._execute_chunk(table, sql, values_sql, part, params)
+        return n
+
+    def _execute_chunk(self, table, sql, values_sql, part, params) -> int:
+        t0 = time.perf_counter()
+        self.cur.execute(sql.format(values=", ".join([values_sql] * len(part))), params)
+        self._record(table, len(part), time.perf_counter() - t0)
+        return self.cur.rowcount
+
+    def insert_raw(self, rows) -> int:
+        if not rows:
+            return 0
+        if self.raw_loader == "infile" and not _infile_disabled:
+            n = self._load_raw_infile(rows)
+            if n is not None:
+                return n
+        return self._insert_many("inventory_raw", _INSERT_RAW, _RAW_VALUES, _RAW_COLS, rows)
+
+    def _load_raw_infile(self, rows):
+        global _infile_disabled
+        f = tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", dir=_infile_dir(),
+                                        suffix=".tsv", delete=False)
+        try:
+            t0 = time.perf_counter()
+            with f:
+                for r in rows:
+                    f.write("\t".join(_infile_field(r[c]) for c in _RAW_COLS))
+                    f.write("\n")
+            try:
+                self.cur.execute(f"""
+                    LOAD DATA LOCAL INFILE %s INTO TABLE inventory_raw
+                    CHARACTER SET utf8mb4
+                    FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                    LINES TERMINATED BY '\\n'
+                    ({", ".join(_RAW_COLS)})
+                """, (f.name,))
+            except Error as e:
+                if e.errno not in _INFILE_DISABLED_ERRNOS:
+                    raise
+                _infile_disabled = True
+                print(f"⚠️ LOAD DATA LOCAL INFILE no disponible ({e.msg}); se usa INSERT por lotes")
+                return None
+            self._record("inventory_raw", len(rows), time.perf_counter() - t0)
+            return self.cur.rowcount
+        finally:
+            os.remove(f.name)
+
+    def upsert_current(self, rows) -> int:
+        if not rows:
+            return 0
+        return self._insert_many("inventory_current", _q("UPSERT_CURRENT", _UPSERT_CURRENT), _CURRENT_VALUES, _CURRENT_COLS, rows)
+
+    def upsert_staging(self, rows) -> int:
+        if not rows:
+            return 0
+        return self._insert_many("inventory_current_staging", _q("UPSERT_STAGING", _UPSERT_STAGING), _RAW_VALUES, _RAW_COLS, rows)
+
+    def clear_staging(self, system_code: str, store_id: int) -> int:
+        self.cur.execute("DELETE FROM inventory_current_staging WHERE system_code=%s AND store_id=%s",
+                         (system_code, store_id))
+        return self.cur.rowcount
 
-        rows: lista de dicts con claves:
-            system_code, store_id, system_id, sku, name, existencia, costo, precio
+    def publish_staging(self, system_code: str, store_id: int) -> dict:
         """
+        Pasa el staging de la tienda/sistema a inventory_current: borra lo que
+        ya no viene, actualiza lo que cambió e inserta lo nuevo. Va en la
+        transacción en curso; el que llama hace commit() justo después.
+        Devuelve cuántas filas se borraron/cambiaron/insertaron.
+        """
+        key = (system_code, store_id)
+        self.cur.execute(_q("PUBLISH_DELETE", _PUBLISH_DELETE), key)
+        deleted = self.cur.rowcount
+        self.cur.execute(_q("PUBLISH_UPDATE", _PUBLISH_UPDATE), (self.run_id, *key))
+        changed = self.cur.rowcount
+        self.cur.execute(_PUBLISH_INSERT, (self.run_id, *key))
+        inserted = self.cur.rowcount
+        return dict(inserted=inserted, changed=changed, deleted=deleted)
+
+    def insert_history(self, rows) -> int:
+        """Filas con change_type (y opcionalmente recorded_at) a inventory_history."""
         if not rows:
-                return 0
-        con = _con(); cur = con.cursor()
-        cur.executemany(
-                """
-                INSERT INTO inventory_raw
-                    (system_code, store_id, system_id, sku, name, existencia, costo, precio)
-                VALUES
-                    (%(system_code)s, %(store_id)s, %(system_id)s, %(sku)s, %(name)s, %(existencia)s, %(costo)s, %(precio)s)
-                """,
-                rows,
-        )
-        con.commit()
-        n = cur.rowcount
-        cur.close(); con.close()
+            return 0
+        return self._insert_many("inventory_history", _INSERT_HISTORY, _HISTORY_VALUES, _HISTORY_COLS, rows)
+
+    def history_from_staging(self, system_code: str, store_id: int) -> int:
+        # Antes de publish_staging(): compara el staging con lo publicado
+        params = (self.run_id, system_code, store_id)
+        self.cur.execute(_q("HISTORY_FROM_STAGING", _HISTORY_FROM_STAGING), params)
+        n = self.cur.rowcount
+        self.cur.execute(_HISTORY_DELETED_FROM_STAGING, params)
+        return n + self.cur.rowcount
+
+    def clear_raw(self, system_code: str, store_id: int) -> int:
+        self.cur.execute("DELETE FROM inventory_raw WHERE system_code=%s AND store_id=%s",
+                         (system_code, store_id))
+        return self.cur.rowcount
+
+    def delete_current(self, system_code: str, store_id: int, system_ids, batch: int = 1000) -> int:
+        system_ids = list(system_ids)
+        n = 0
+        for i in range(0, len(system_ids), batch):
+            part = system_ids[i:i + batch]
+            marks = ", ".join(["%s"] * len(part))
+            self.cur.execute(f"""
+                DELETE FROM inventory_current
+                 WHERE system_code=%s AND store_id=%s AND system_id IN ({marks})
+            """, (system_code, store_id, *part))
+            n += self.cur.rowcount
         return n
 
-def bulk_upsert_inventory_current(rows):
+    def sweep_current(self, system_code: str, store_id: int) -> int:
         """
-        Upsert masivo en inventory_current usando una sola conexión.
+        Barrido después de una corrida full exitosa (el upsert marcó con
+        run_id todas las filas del export): una sola sentencia que borra las
+        filas marcadas con corridas anteriores (índice idx_current_run).
+        """
+        self.cur.execute("""
+            DELETE FROM inventory_current
+             WHERE system_code=%s AND store_id=%s AND run_id < %s
+        """, (system_code, store_id, self.run_id))
+        return self.cur.rowcount
 
-        rows: lista de dicts con claves:
-            system_code, store_id, system_id, sku, name, existencia, costo, precio, seen_at(opcional)
+    def summary_skus(self, system_code: str, store_id: int, sweep: bool = True) -> set:
         """
-        if not rows:
-                return 0
-        con = _con(); cur = con.cursor()
-        cur.executemany(
-                """
-                INSERT INTO inventory_current
-                    (system_code, store_id, system_id, sku, name, existencia, costo, precio, last_seen_at)
-                VALUES
-                    (%(system_code)s, %(store_id)s, %(system_id)s, %(sku)s, %(name)s, %(existencia)s, %(costo)s, %(precio)s, COALESCE(%(seen_at)s, CURRENT_TIMESTAMP))
-                ON DUPLICATE KEY UPDATE
-                     sku=VALUES(sku),
-                     name=VALUES(name),
-                     existencia=VALUES(existencia),
-                     costo=VALUES(costo),
-                     precio=VALUES(precio),
-                     last_seen_at=VALUES(last_seen_at)
-                """,
-                rows,
-        )
-        con.commit()
-        n = cur.rowcount
-        cur.close(); con.close()
-        return n
+        SKUs que tocó esta corrida: los de su historial y, con `sweep`, los de
+        las filas que va a borrar el barrido. Antes de sweep_current().
+        """
+        if not sweep:
+            self.cur.execute("SELECT sku FROM inventory_history WHERE run_id=%s", (self.run_id,))
+            return {sku for (sku,) in self.cur.fetchall() if sku is not None}
+        self.cur.execute("""
+            SELECT sku FROM inventory_history WHERE run_id=%s
+            UNION
+            SELECT sku FROM inventory_current WHERE system_code=%s AND store_id=%s AND run_id < %s
+        """, (self.run_id, system_code, store_id, self.run_id))
+        return {sku for (sku,) in self.cur.fetchall() if sku is not None}
+
+    def staging_moved_skus(self, system_code: str, store_id: int) -> set:
+        # Antes de publish_staging(): SKU anterior de las filas que cambian de SKU
+        self.cur.execute("""
+            SELECT c.sku FROM inventory_current c
+              JOIN inventory_current_staging s
+                ON s.system_code=c.system_code AND s.store_id=c.store_id AND s.system_id=c.system_id
+             WHERE c.system_code=%s AND c.store_id=%s AND c.sku IS NOT NULL
+               AND (s.sku IS NULL OR s.sku <> c.sku)
+        """, (system_code, store_id))
+        return {sku for (sku,) in self.cur.fetchall()}
+
+    def refresh_summary(self, skus, batch: int = 500) -> int:
+        """
+        Recalcula product_summary para `skus` (y borra los que quedaron sin
+        filas). Después del commit del inventario, una transacción corta por
+        lote: en MySQL con READ COMMITTED el SELECT sobre inventory_current es
+        una lectura consistente, sin bloqueos compartidos sobre las filas que
+        el otro sistema está escribiendo en su propia transacción. En orden de
+        SKU: dos escritores que comparten SKUs bloquean product_summary en el
+        mismo orden.
+        """
+        skus = sorted(set(skus))
+        try:
+            for i in range(0, len(skus), batch):
+                part = skus[i:i + batch]
+                marks = ", ".join(["%s"] * len(part))
+                if _backend.name == "mysql":
+                    # Solo para la próxima transacción (la de este lote)
+                    self.cur.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+                _upsert_summary(self.cur, f"AND i.sku IN ({marks})", part)
+                self.cur.execute(_DELETE_EMPTY_SUMMARY.format(marks=marks), part)
+                self.commit()
+        except Exception:
+            self.con.rollback()
+            raise
+        return len(skus)
+
+    def finish_run(self, row_count: int, swept: int = None):
+        # Después de confirmar los datos: 'ok' solo si todo quedó escrito
+        self.cur.execute("""
+            UPDATE ingestion_runs SET status='ok', row_count=%s, swept=%s, finished_at=CURRENT_TIMESTAMP
+             WHERE id=%s
+        """, (row_count, swept, self.run_id))
+
+    def save_export_hash(self, system_code: str, store_id: int, content_hash: str, row_count: int):
+        self.cur.execute(_q("SAVE_EXPORT_HASH", _SAVE_EXPORT_HASH), (system_code, store_id, content_hash, row_count))
+
+    def rows_per_sec(self) -> float:
+        rows = sum(r for _, r, _ in self.stats)
+        secs = sum(t for _, _, t in self.stats)
+        return rows / secs if secs else 0.0
+
+def bulk_insert_inventory_raw(rows):
+    """
+    Inserta muchas filas en inventory_raw en una sola conexión (INSERT
+    multi-fila por lotes, ver InventoryWriter).
+
+    rows: lista de dicts con claves:
+        system_code, store_id, system_id, sku, name, existencia, costo, precio
+    """
+    if not rows:
+        return 0
+    with InventoryWriter() as w:
+        return w.insert_raw(rows)
+
+def load_inventory_raw(rows) -> int:
+    """
+    Igual que bulk_insert_inventory_raw pero con LOAD DATA LOCAL INFILE: las
+    filas se escriben a un TSV temporal y MySQL lo carga en una sola sentencia,
+    sin armar parámetros por fila en Python.
+
+    Si el servidor (local_infile=OFF) o el cliente no lo permiten, usa
+    INSERT multi-fila y no lo vuelve a intentar en este proceso.
+    """
+    if not rows:
+        return 0
+    with InventoryWriter(raw_loader="infile") as w:
+        return w.insert_raw(rows)
+
+def bulk_upsert_inventory_current(rows):
+    """
+    Upsert masivo en inventory_current usando una sola conexión.
+
+    rows: lista de dicts con claves:
+        system_code, store_id, system_id, sku, name, existencia, costo, precio, seen_at(opcional)
+    """
+    if not rows:
+        return 0
+    with InventoryWriter() as w:
+        return w.upsert_current(rows)
+
+def load_inventory_current(system_code: str, store_id: int) -> dict:
+    """
+    Estado actual de una tienda/sistema en una sola consulta:
+    {system_id: (sku, name, existencia, costo, precio)}. Lo usa el modo delta.
+    """
+    con = _con(); cur = con.cursor()
+    cur.execute("""
+        SELECT system_id, sku, name, existencia, costo, precio
+          FROM inventory_current
+         WHERE system_code=%s AND store_id=%s
+    """, (system_code, store_id))
+    state = {r[0]: tuple(r[1:]) for r in cur}
+    cur.close(); con.close()
+    return state
+
+def delete_inventory_current(system_code: str, store_id: int, system_ids, batch: int = 1000) -> int:
+    """
+    Borra de inventory_current los system_id indicados (los que ya no vienen
+    en el export), en lotes para no armar un IN gigante.
+    """
+    system_ids = list(system_ids)
+    if not system_ids:
+        return 0
+    con = _con(); cur = con.cursor()
+    n = 0
+    for i in range(0, len(system_ids), batch):
+        part = system_ids[i:i + batch]
+        marks = ", ".join(["%s"] * len(part))
+        cur.execute(f"""
+            DELETE FROM inventory_current
+             WHERE system_code=%s AND store_id=%s AND system_id IN ({marks})
+        """, (system_code, store_id, *part))
+        n += cur.rowcount
+    con.commit()
+    cur.close(); con.close()
+    return n
 
 def prune_old_inventory(system_code: str, store_id: int, older_than_minutes: int = 60):
     """
     Para limpiezas después de una corrida: borra los registros que no se vieron
     en la última pasada (marcados por last_seen_at muy viejo).
+    La ingesta ya no lo usa: barre por run_id (InventoryWriter.sweep_current).
     """
     cutoff = datetime.utcnow() - timedelta(minutes=older_than_minutes)
     con = _con(); cur = con.cursor()
@@ -220,6 +928,67 @@ def prune_old_inventory(system_code: str, store_id: int, older_than_minutes: int
     con.commit()
     cur.close(); con.close()
 
+def rebuild_product_summary() -> int:
+    """
+    Rearma product_summary completa desde inventory_current. La ingesta la
+    mantiene sola; esto es para después de editar product_assets o de tocar
+    inventory_current a mano.
+    """
+    con = _con(); cur = con.cursor()
+    cur.execute("DELETE FROM product_summary")
+    _upsert_summary(cur)
+    n = cur.rowcount
+    con.commit()
+    cur.close(); con.close()
+    return n
+
+# ---------------------------------------------------------------------
+# Caché de exports: si el archivo no cambió desde la última corrida no se reingiere
+# ---------------------------------------------------------------------
+def get_export_hash(system_code: str, store_id: int):
+    """
+    Devuelve (content_hash, row_count) del último export ingerido para esa
+    tienda/sistema, o None si no hay.
+    """
+    con = _con(); cur = con.cursor()
+    cur.execute("""
+        SELECT content_hash, row_count FROM ingest_export_cache
+         WHERE system_code=%s AND store_id=%s
+    """, (system_code, store_id))
+    row = cur.fetchone()
+    cur.close(); con.close()
+    return (row[0], int(row[1])) if row else None
+
+_SAVE_EXPORT_HASH = """
+    INSERT INTO ingest_export_cache (system_code, store_id, content_hash, row_count)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+       content_hash=VALUES(content_hash),
+       row_count=VALUES(row_count),
+       updated_at=CURRENT_TIMESTAMP
+"""
+
+def save_export_hash(system_code: str, store_id: int, content_hash: str, row_count: int):
+    con = _con(); cur = con.cursor()
+    cur.execute(_q("SAVE_EXPORT_HASH", _SAVE_EXPORT_HASH), (system_code, store_id, content_hash, row_count))
+    con.commit()
+    cur.close(); con.close()
+
+def touch_export_hash(system_code: str, store_id: int) -> int:
+    """
+    Export idéntico al anterior: solo marca la tienda/sistema como vista ahora
+    (ingest_export_cache.updated_at), sin tocar inventory_current.
+    """
+    con = _con(); cur = con.cursor()
+    cur.execute("""
+        UPDATE ingest_export_cache SET updated_at=CURRENT_TIMESTAMP
+         WHERE system_code=%s AND store_id=%s
+    """, (system_code, store_id))
+    con.commit()
+    n = cur.rowcount
+    cur.close(); con.close()
+    return n
+
 def clear_store_inventory(system_code: str, store_id: int):
     """
     Limpia la tabla 'inventory_raw' para esa tienda/sistema antes de reinsertar
@@ -231,16 +1000,181 @@ def clear_store_inventory(system_code: str, store_id: int):
     con.commit()
     cur.close(); con.close()
 
+# ---------------------------------------------------------------------
+# Capa async para los scrapers (Playwright): las llamadas bloqueantes de
+# mysql-connector corren en hilos propios, no en el loop de asyncio, así un
+# sistema escribiendo en la BD no frena el navegador del otro.
+# ---------------------------------------------------------------------
+_db_executor = None
+
+def _get_db_executor() -> ThreadPoolExecutor:
+    # Tantos hilos como conexiones en el pool: más solo esperarían en _con()
+    global _db_executor
+    with _pool_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="db-async")
+        return _db_executor
+
+async def run_db(fn, *args, **kwargs):
+    """Ejecuta fn(*args, **kwargs) (cualquier función de este módulo) fuera del loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_db_executor(), functools.partial(fn, *args, **kwargs))
+
+# A y B arrancan a la vez: el esquema se revisa una sola vez por proceso. Los
+# pasos de ensure_tables (revisar y luego ALTER, construir product_summary)
+# corridos en paralelo chocan entre sí (1060/1061/1091, dos builds a la vez)
+_tables_ready = False
+_tables_lock = threading.Lock()
+
+def _ensure_tables_once():
+    global _tables_ready
+    with _tables_lock:
+        if not _tables_ready:
+            ensure_tables()
+            _tables_ready = True
+
+async def ensure_tables_async():
+    return await run_db(_ensure_tables_once)
+
+async def ensure_store_async(store_id: int, name: str):
+    return await run_db(ensure_store, store_id, name)
+
+# ---------------------------------------------------------------------
+# Historial de cambios (inventory_history)
+# ---------------------------------------------------------------------
+def _last_history(cur, system_code: str, store_id: int) -> dict:
+    # Último estado registrado por system_id (None si lo último fue un borrado)
+    cur.execute("""
+        SELECT h.system_id, h.sku, h.name, h.existencia, h.costo, h.precio, h.change_type
+          FROM inventory_history h
+          JOIN (SELECT MAX(id) AS id FROM inventory_history
+                 WHERE system_code=%s AND store_id=%s GROUP BY system_id) last
+            ON last.id=h.id
+    """, (system_code, store_id))
+    return {r[0]: (None if r[6] == "deleted" else tuple(r[1:6])) for r in cur}
+
+def compact_inventory_raw(system_code: str = None, store_id: int = None, batch: int = 5000,
+                          dump_gap_minutes: float = 10) -> dict:
+    """
+    Pasa los dumps de inventory_raw al formato de inventory_history: recorre
+    las filas de cada tienda/sistema en orden y solo registra las que cambian
+    respecto de la anterior (o de lo que ya tenía el historial), con la fecha
+    del dump. Un system_id que venía en un dump y falta en el siguiente queda
+    como 'deleted'. inventory_raw no guarda la corrida: un dump nuevo empieza
+    cuando entre dos filas pasan más de `dump_gap_minutes`. Las filas sin
+    system_id propio (row-N, el número de fila) se saltan: cambia de un export
+    a otro y no identifica nada. Luego borra esas filas de inventory_raw.
+    Cada tienda/sistema es una corrida 'compact' en ingestion_runs y una
+    transacción.
+    Devuelve {(system_code, store_id): (filas leídas, filas al historial)}.
+    """
+    gap = timedelta(minutes=dump_gap_minutes)
+    con = _con(); cur = con.cursor()
+    where, params = [], []
+    if system_code is not None:
+        where.append("system_code=%s"); params.append(system_code)
+    if store_id is not None:
+        where.append("store_id=%s"); params.append(store_id)
+    cur.execute("SELECT DISTINCT system_code, store_id FROM inventory_raw"
+                + (" WHERE " + " AND ".join(where) if where else ""), params)
+    stores = cur.fetchall()
+
+    out = {}
+    for sc, sid in stores:
+        state = _last_history(cur, sc, sid)
+        run_id = begin_ingestion_run(sc, sid, "compact")
+        read = written = 0
+        # system_ids del dump anterior y del que se está leyendo
+        prev_ids, dump_ids = None, set()
+        dump_at = last_at = None
+
+        def _gone(recorded_at):
+            # Venían en el dump anterior y no en este: borrados
+            rows = []
+            for system_id in (prev_ids or set()) - dump_ids:
+                old = state.get(system_id)
+                if old is None:
+                    continue
+                state[system_id] = None
+                rows.append(dict(
+                    system_code=sc, store_id=sid, system_id=system_id, sku=old[0], name=old[1],
+                    existencia=old[2], costo=old[3], precio=old[4], recorded_at=recorded_at,
+                    change_type="deleted",
+                ))
+            return rows
+
+        try:
+            with InventoryWriter(run_id=run_id) as writer:
+                cur.execute("""
+                    SELECT system_id, sku, name, existencia, costo, precio, created_at
+                      FROM inventory_raw
+                     WHERE system_code=%s AND store_id=%s AND system_id IS NOT NULL AND system_id<>''
+                       AND system_id NOT LIKE 'row-%%'
+                     ORDER BY id
+                """, (sc, sid))
+                while True:
+                    rows = cur.fetchmany(batch)
+                    if not rows:
+                        break
+                    read += len(rows)
+                    changes = []
+                    for system_id, sku, name, existencia, costo, precio, created_at in rows:
+                        if last_at is not None and created_at - last_at > gap:
+                            changes += _gone(dump_at)
+                            prev_ids, dump_ids = dump_ids, set()
+                        if not dump_ids:
+                            dump_at = created_at
+                        last_at = created_at
+                        dump_ids.add(system_id)
+                        key = (sku, name, existencia, costo, precio)
+                        old = state.get(system_id, False)
+                        if old == key:
+                            continue
+                        state[system_id] = key
+                        changes.append(dict(
+                            system_code=sc, store_id=sid, system_id=system_id, sku=sku, name=name,
+                            existencia=existencia, costo=costo, precio=precio, recorded_at=created_at,
+                            change_type="changed" if old else "new",
+                        ))
+                    written += writer.insert_history(changes)
+                written += writer.insert_history(_gone(dump_at))
+                writer.clear_raw(sc, sid)
+                writer.finish_run(written)
+        except Exception as e:
+            fail_ingestion_run(run_id, e)
+            raise
+        out[(sc, sid)] = (read, written)
+
+    cur.close(); con.close()
+    return out
+
 # ---------------------------------------------------------------------
 # Capa de compatibilidad que espera core_scraper_xls.py
 #   (no cambia tus tablas actuales)
 # ---------------------------------------------------------------------
-def begin_ingestion_run(system_code: str, store_id: int) -> int:
+def begin_ingestion_run(system_code: str, store_id: int, mode: str = None, content_hash: str = None) -> int:
     """
-    El core pide un run_id; nuestro esquema no lo usa.
-    Devolvemos 0 como marcador.
+    Registra una corrida (status 'running') y devuelve su id. Se confirma
+    de inmediato para que quede aunque la ingesta falle.
     """
-    return 0
+    con = _con(); cur = con.cursor()
+    cur.execute("""
+        INSERT INTO ingestion_runs (system_code, store_id, mode, content_hash)
+        VALUES (%s, %s, %s, %s)
+    """, (system_code, store_id, mode, content_hash))
+    run_id = cur.lastrowid
+    con.commit()
+    cur.close(); con.close()
+    return run_id
+
+def fail_ingestion_run(run_id: int, error: str):
+    con = _con(); cur = con.cursor()
+    cur.execute("""
+        UPDATE ingestion_runs SET status='error', error=%s, finished_at=CURRENT_TIMESTAMP
+         WHERE id=%s
+    """, (str(error)[:1000], run_id))
+    con.commit()
+    cur.close(); con.close()
 
 def insert_inventory_raw(run_id: int, system_code: str, store_id: int,
                          system_id: str, sku: str, name: str,
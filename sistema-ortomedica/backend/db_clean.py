@@ -11,5 +11,6 @@ def clear_all_inventory():
     cur.execute("TRUNCATE TABLE inventory_raw")
     # Limpiar inventory_current (estado actual)
     cur.execute("DELETE FROM inventory_current")
+    cur.execute("DELETE FROM product_summary")
     con.commit()
     cur.close(); con.close()
\ No newline at end of file
@@ -0,0 +1,289 @@
+# export_snapshots.py
+"""
+Snapshot columnar de cada export ya parseado: un archivo por
+(system_code, store_id, corrida) con las filas tal como se escribieron en
+inventory_raw / inventory_current.
+
+Formato (little-endian):
+
+    b"ORTSNAP1" | uint64 largo del encabezado | encabezado JSON | columnas
+
+Cada columna es un arreglo NumPy alineado a 64 bytes; el encabezado guarda
+dtype, offset y largo de cada una. Los textos (system_id, sku, name) van en
+una tabla de strings sin repetidos (offsets uint64 + bytes UTF-8) y las
+columnas guardan el índice. existencia/costo/precio son int64/float64 con
+una máscara de nulos aparte.
+
+load_snapshot() mapea el archivo en memoria (las columnas numéricas son
+vistas sobre el mmap) y iter_chunks() devuelve los mismos lotes que arma
+core_scraper_xls._convert_chunk: sirve para reprocesar sin navegador ni
+parsear el HTML otra vez.
+
+Uso (desde backend/):
+    python export_snapshots.py info snapshots/SISTEMA_A_1_20251018T101500.snap
+    python export_snapshots.py replay snapshots/SISTEMA_A_1_20251018T101500.snap
+"""
+import os
+import sys
+import json
+import mmap
+import glob
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+MAGIC = b"ORTSNAP1"
+VERSION = 1
+_ALIGN = 64
+
+# Carpeta de los snapshots (SNAPSHOT_DIR en .env)
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+
+_STR_COLS = ("system_id", "sku", "name")
+_NUM_COLS = (("existencia", np.int64), ("costo", np.float64), ("precio", np.float64))
+
+def snapshot_dir() -> str:
+    return os.getenv("SNAPSHOT_DIR") or DEFAULT_DIR
+
+# -------------------- Escritura --------------------
+
+class SnapshotWriter:
+    """
+    Acumula los lotes (raw_rows, current_rows) de una ingesta en arreglos
+    compactos y los escribe en un solo archivo con save().
+    """
+
+    def __init__(self, system_code: str, store_id: int, content_hash: str = None):
+        self.system_code = system_code
+        self.store_id = store_id
+        self.content_hash = content_hash
+        self._index: Dict[str, int] = {}
+        self._strings: List[bytes] = []
+        self._parts: Dict[str, list] = {c: [] for c in self._columns()}
+        self.rows = 0
+
+    @staticmethod
+    def _columns():
+        cols = list(_STR_COLS) + ["in_current"]
+        for name, _ in _NUM_COLS:
+            cols += [name, name + "_null"]
+        return cols
+
+    def _intern(self, values) -> np.ndarray:
+        index = self._index
+        out = np.empty(len(values), dtype=np.uint32)
+        for i, v in enumerate(values):
+            k = index.get(v)
+            if k is None:
+                k = index[v] = len(self._strings)
+                self._strings.append(v.encode("utf-8"))
+            out[i] = k
+        return out
+
+    def add(self, raw_rows: List[dict], current_rows: List[dict]):
+        """
+        Agrega un lote. current_rows es la subsecuencia de raw_rows con
+        system_id (en el mismo orden), así que se marca recorriendo ambas.
+        """
+        if not raw_rows:
+            return
+        n = len(raw_rows)
+        in_current = np.zeros(n, dtype=np.uint8)
+        k = 0
+        for i, r in enumerate(raw_rows):
+            if k < len(current_rows) and current_rows[k]["system_id"] == r["system_id"]:
+                in_current[i] = 1
+                k += 1
+
+        parts = self._parts
+        for col in _STR_COLS:
+            parts[col].append(self._intern([r[col] or "" for r in raw_rows]))
+        parts["in_current"].append(in_current)
+        for col, dtype in _NUM_COLS:
+            values = [r[col] for r in raw_rows]
+            nulls = np.fromiter((v is None for v in values), dtype=np.uint8, count=n)
+            # int64 fuera de rango levanta OverflowError: el que llama decide (ver core)
+            parts[col].append(np.array([0 if v is None else v for v in values], dtype=dtype))
+            parts[col + "_null"].append(nulls)
+        self.rows += n
+
+    def save(self, run: str = None) -> str:
+        """
+        Escribe el archivo (primero a .tmp y luego rename, para que un lector
+        nunca vea uno a medias) y devuelve su ruta.
+        """
+        run = run or datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        folder = snapshot_dir()
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{self.system_code}_{self.store_id}_{run}.snap")
+
+        blob = b"".join(self._strings)
+        offsets = np.zeros(len(self._strings) + 1, dtype=np.uint64)
+        np.cumsum([len(s) for s in self._strings], out=offsets[1:])
+        arrays = {"str_offsets": offsets, "str_data": np.frombuffer(blob, dtype=np.uint8)}
+        for col, parts in self._parts.items():
+            dtype = parts[0].dtype if parts else np.uint8
+            arrays[col] = np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
+
+        header = dict(
+            version=VERSION,
+            system_code=self.system_code,
+            store_id=self.store_id,
+            run=run,
+            content_hash=self.content_hash,
+            created_at=datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            rows=self.rows,
+            strings=len(self._strings),
+            columns={},
+        )
+        # Offsets relativos al inicio de los datos (después del encabezado, alineado)
+        layout, pos = {}, 0
+        for col, arr in arrays.items():
+            pos = -(-pos // _ALIGN) * _ALIGN
+            layout[col] = (arr.dtype.str, pos, int(arr.size))
+            pos += arr.nbytes
+        header["columns"] = layout
+        head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        start = -(-(len(MAGIC) + 8 + len(head)) // _ALIGN) * _ALIGN
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(head).to_bytes(8, "little"))
+            f.write(head)
+            for col, arr in arrays.items():
+                f.seek(start + layout[col][1])
+                f.write(arr.tobytes())
+            f.truncate(start + pos)  # columnas vacías al final también quedan dentro del archivo
+        os.replace(tmp, path)
+        return path
+
+def prune_snapshots(system_code: str, store_id: int, keep: int) -> int:
+    """Deja solo los `keep` snapshots más recientes de la tienda/sistema."""
+    paths = sorted(glob.glob(os.path.join(snapshot_dir(), f"{system_code}_{store_id}_*.snap")),
+                   key=os.path.getmtime)
+    old = paths[:-keep] if keep > 0 else paths
+    for p in old:
+        os.remove(p)
+    return len(old)
+
+# -------------------- Lectura --------------------
+
+class Snapshot:
+    """
+    Snapshot mapeado en memoria. `columns` tiene los arreglos como vistas
+    sobre el mmap (no se copian); strings() decodifica la tabla de textos.
+    Cerrar con close() (o usar como context manager).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: no es un snapshot de export")
+        n = int.from_bytes(self._mm[len(MAGIC):len(MAGIC) + 8], "little")
+        head_end = len(MAGIC) + 8 + n
+        self.meta = json.loads(self._mm[len(MAGIC) + 8:head_end].decode("utf-8"))
+        start = -(-head_end // _ALIGN) * _ALIGN
+        self.columns = {
+            col: np.frombuffer(self._mm, dtype=np.dtype(dt), count=count, offset=start + off)
+            for col, (dt, off, count) in self.meta["columns"].items()
+        }
+        self._strings = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Las vistas de NumPy retienen el mmap: se sueltan antes de cerrarlo
+        self.columns = {}
+        self._strings = None
+        self._mm.close()
+        self._file.close()
+
+    def strings(self) -> List[str]:
+        if self._strings is None:
+            offsets = self.columns["str_offsets"].tolist()
+            data = self.columns["str_data"].tobytes()
+            self._strings = [data[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return self._strings
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def iter_chunks(self, chunk_size: int = 5000) -> Iterator[Tuple[List[dict], List[dict]]]:
+        """
+        Reconstruye los lotes (filas de inventory_raw, filas de inventory_current)
+        igual que los produjo el parseo original.
+        """
+        system_code, store_id = self.meta["system_code"], self.meta["store_id"]
+        table = self.strings()
+        cols = self.columns
+        for start in range(0, len(self), chunk_size):
+            sl = slice(start, start + chunk_size)
+            sids, skus, names = (cols[c][sl].tolist() for c in _STR_COLS)
+            in_current = cols["in_current"][sl].tolist()
+            nums = []
+            for col, _ in _NUM_COLS:
+                values = cols[col][sl].tolist()
+                nulls = cols[col + "_null"][sl].tolist()
+                nums.append([None if z else v for v, z in zip(values, nulls)])
+
+            raw_rows, current_rows = [], []
+            for sid, sku, name, cur, existencia, costo, precio in zip(
+                    sids, skus, names, in_current, *nums):
+                row = dict(
+                    system_code=system_code,
+                    store_id=store_id,
+                    system_id=table[sid],
+                    sku=table[sku],
+                    name=table[name],
+                    existencia=existencia,
+                    costo=costo,
+                    precio=precio,
+                )
+                raw_rows.append(row)
+                if cur:
+                    current_rows.append(dict(row, seen_at=None))
+            yield raw_rows, current_rows
+
+def load_snapshot(path: str) -> Snapshot:
+    return Snapshot(path)
+
+# -------------------- CLI --------------------
+
+def _main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_info = sub.add_parser("info", help="muestra el encabezado y las primeras filas")
+    p_info.add_argument("path")
+    p_info.add_argument("--rows", type=int, default=5)
+    p_replay = sub.add_parser("replay", help="vuelve a escribir el snapshot en la BD")
+    p_replay.add_argument("path")
+    p_replay.add_argument("--mode", choices=("delta", "full", "staging"),
+                          help="cómo escribir inventory_current (default: INGEST_MODE)")
+    args = ap.parse_args()
+
+    if args.cmd == "info":
+        with load_snapshot(args.path) as snap:
+            meta = {k: v for k, v in snap.meta.items() if k != "columns"}
+            print(json.dumps(meta, indent=2, ensure_ascii=False))
+            raw_rows, _ = next(snap.iter_chunks(args.rows), ([], []))
+            for r in raw_rows:
+                print(r)
+        return
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from scrapers.core_scraper_xls import replay_snapshot, format_summary
+    summary = replay_snapshot(args.path, mode=args.mode)
+    print(format_summary(summary))
+
+if __name__ == "__main__":
+    _main()
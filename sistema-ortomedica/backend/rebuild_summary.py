@@ -0,0 +1,27 @@
+# rebuild_summary.py
+"""
+Rearma product_summary completa desde inventory_current. La ingesta la
+mantiene sola (solo los SKUs que tocó cada corrida); esto es para después
+de cambiar product_assets (imágenes) o de editar inventory_current a mano.
+
+Uso (desde backend/):
+    python rebuild_summary.py
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db  # noqa: E402
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    db.ensure_tables()
+    n = db.rebuild_product_summary()
+    print(f"product_summary: {n} SKUs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# response_cache.py
+"""
+Caché LRU de respuestas de la API (/products), en memoria del proceso.
+
+Las respuestas se guardan ya serializadas (bytes JSON): el límite es de
+memoria real (max_bytes) y un acierto no vuelve a serializar. Cada entrada
+vence a los `ttl` segundos y además lleva la generación con la que se
+calculó; cuando la generación cambia (terminó una ingesta) la caché se vacía
+entera.
+
+`generation()` la da quien usa la caché (en la API: la última corrida ok de
+ingestion_runs y la versión del índice de búsqueda). Se consulta como mucho
+cada `check_every` segundos; bump() obliga a consultarla en el próximo uso.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+class ResponseCache:
+
+    def __init__(self, max_bytes: int, ttl: float, generation: Callable[[], object],
+                 check_every: float = 5.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.check_every = check_every
+        self._generation_fn = generation
+        self._generation = None
+        self._checked_at = 0.0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.evictions = self.expirations = self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def bump(self):
+        """Terminó una ingesta: revisar la generación en el próximo get()."""
+        self._checked_at = 0.0
+
+    def generation(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_every:
+            gen = self._generation_fn()
+            with self._lock:
+                self._checked_at = now
+                if gen != self._generation:
+                    if self._entries:
+                        self.invalidations += 1
+                    self._entries.clear()
+                    self._bytes = 0
+                    self._generation = gen
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        gen = self.generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_gen, expires, body = entry
+                if entry_gen == gen and time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return body
+                self._drop(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, body: bytes, generation) -> None:
+        """
+        Guarda `body` calculado con `generation` (la que devolvió generation()
+        antes de calcularlo: si cambió mientras tanto, no se guarda).
+        """
+        size = len(body)
+        # Una respuesta enorme no vale la caché: sacaría a todas las demás
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (generation, time.monotonic() + self.ttl, body)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._drop(old_key)
+                self.evictions += 1
+
+    def _drop(self, key: Hashable):
+        _, _, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                enabled=self.enabled,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl,
+                generation=self._generation,
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=round(self.hits / lookups, 4) if lookups else None,
+                evictions=self.evictions,
+                expirations=self.expirations,
+                invalidations=self.invalidations,
+            )
@@ -1,6 +1,7 @@
 # run_scrapers.py
 import os
 import sys
+import time
 import asyncio
 import argparse
 from typing import Callable, Optional
@@ -44,9 +45,28 @@ else:
 
 # from db_clean import clear_all_inventory  # Evitamos limpiar toda la base en cada corrida (costoso)
 
+async def _timed(code: str, coro, timings: dict):
+    # (inicio, fin) de cada sistema, para ver en el resumen si de verdad se solaparon
+    t0 = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[code] = (t0, time.perf_counter())
+
+def _print_timings(timings: dict, t_start: float):
+    if not timings:
+        return
+    print("\n========== Tiempos ==========")
+    for code, (t0, t1) in sorted(timings.items()):
+        print(f"{code}: {t1 - t0:7.1f}s  (de {t0 - t_start:6.1f}s a {t1 - t_start:6.1f}s)")
+    wall = max(t1 for _, t1 in timings.values()) - t_start
+    serial = sum(t1 - t0 for t0, t1 in timings.values())
+    if len(timings) > 1:
+        print(f"Total: {wall:.1f}s (en serie serían {serial:.1f}s, solapado {serial - wall:.1f}s)")
+
 async def run_selected(systems: list[str], debug: bool, stop_on_error: bool):
     # Limpiar toda la base antes de cada corrida puede ser costoso y no necesario
-    # ya que cada scraper limpia por bodega (clear_store_inventory). Mantén este bloque
+    # ya que process_spreadsheet limpia por bodega (clear_store_inventory). Mantén este bloque
     # solo si realmente necesitas un reset completo.
     # print("\n========== Limpiando base de datos ==========")
     # clear_all_inventory()
@@ -54,13 +74,14 @@ async def run_selected(systems: list[str], debug: bool, stop_on_error: bool):
 
     results = {}
     tasks = []
+    timings = {}
     if "a" in systems:
         if MAIN_A is None:
             print("❌ Sistema A no disponible (import falló).")
             results["A"] = "not_available"
         else:
             print("\n⇒ Programando SISTEMA A…")
-            tasks.append(MAIN_A(debug=debug))
+            tasks.append(_timed("A", MAIN_A(debug=debug), timings))
 
     if "b" in systems:
         if MAIN_B is None:
@@ -68,11 +89,14 @@ async def run_selected(systems: list[str], debug: bool, stop_on_error: bool):
             results["B"] = "not_available"
         else:
             print("\n⇒ Programando SISTEMA B…")
-            tasks.append(MAIN_B(debug=debug))
+            tasks.append(_timed("B", MAIN_B(debug=debug), timings))
 
     # Ejecuta en paralelo los sistemas seleccionados
     if tasks:
         print("\n========== Ejecutando scrapers en paralelo ==========")
+        # Los scrapers hacen la BD fuera del loop (db.run_db / ExportPipeline):
+        # mientras uno escribe, el navegador del otro sigue avanzando
+        t_start = time.perf_counter()
         try:
             await asyncio.gather(*tasks)
             for s in ("A","B"):
@@ -83,6 +107,8 @@ async def run_selected(systems: list[str], debug: bool, stop_on_error: bool):
             print(f"❌ Error en ejecución: {e}")
             if stop_on_error:
                 return results
+        finally:
+            _print_timings(timings, t_start)
 
     return results
 
@@ -1,126 +1,366 @@
 # core_scraper_xls.py
 import io
-from typing import Dict, List, Tuple
+import os
+import re
+import csv
+import mmap
+import pickle
+import asyncio
+import tempfile
+import multiprocessing
+import codecs
+import hashlib
+import time
+import queue
+import threading
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, Union
 from openpyxl import load_workbook
 import xlrd  # 1.2.0
-from bs4 import BeautifulSoup
+from lxml import etree
 
-from utils import parse_price, to_int_loose, txt
+from utils import parse_price_column, to_int_loose_column, txt
+from export_snapshots import SnapshotWriter, load_snapshot, prune_snapshots
 from db import (
     ensure_product_and_alias,
     upsert_stock,
     begin_ingestion_run,
+    fail_ingestion_run,
     insert_inventory_raw,
-    bulk_insert_inventory_raw,
-    bulk_upsert_inventory_current,
+    InventoryWriter,
+    get_export_hash,
+    touch_export_hash,
+    load_inventory_current,
+    connection_stats,
+    run_db,
 )
 
+# Los lectores reciben el export como bytes o como mmap del archivo descargado
+Buffer = Union[bytes, mmap.mmap]
+
+# -------------------- Fuente del export --------------------
+
+@contextlib.contextmanager
+def _open_source(source: Union[Buffer, str, os.PathLike]) -> Iterator[Buffer]:
+    """
+    Acepta bytes, un mmap ya abierto o la ruta del archivo descargado. Las rutas
+    se mapean en memoria (solo lectura): los lectores parsean directo del archivo
+    sin copiarlo completo al heap del proceso.
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        yield source
+        return
+    with open(source, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""  # mmap no acepta archivos vacíos
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+class _MmapReader(io.RawIOBase):
+    """
+    Objeto tipo archivo sobre un mmap, sin copiarlo. El mmap trae read/seek
+    pero no seekable(), que zipfile (openpyxl) necesita.
+    """
+    def __init__(self, mm: mmap.mmap):
+        self._mm = mm
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += len(self._mm)
+        self._pos = max(0, pos)
+        return self._pos
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._mm) - self._pos))
+        b[:n] = self._mm[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+def _as_file(data: Buffer):
+    # lxml/openpyxl leen de un objeto tipo archivo
+    if isinstance(data, mmap.mmap):
+        return _MmapReader(data)
+    return io.BytesIO(data)
+
 # -------------------- Lectores --------------------
 
 def _normalize_headers(headers: List[str]) -> List[str]:
     # Normaliza y pasa a minúsculas para que no importe la capitalización
     return [str(h or "").strip().lower() for h in headers]
 
-def _read_html_table(data: bytes) -> Tuple[List[str], List[List]]:
+def _guess_encoding(data: Buffer) -> str:
+    """
+    Misma regla que antes (utf-8 y si falla latin-1), pero validando por bloques
+    con un decodificador incremental: no se arma una copia str de todo el archivo.
+    Devuelve el nombre que entiende libxml2 ("iso-8859-1" en vez de "latin-1").
+    """
+    dec = codecs.getincrementaldecoder("utf-8")()
+    step = 1 << 20
+    # memoryview en un with: si queda vivo, el mmap no se puede cerrar
+    with memoryview(data) as view:
+        try:
+            for off in range(0, len(view), step):
+                dec.decode(view[off:off + step])
+            dec.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "iso-8859-1"
+    return "utf-8"
+
+def _cell_text(el) -> str:
+    # Equivale a get_text(strip=True) de BeautifulSoup
+    return "".join(t.strip() for t in el.itertext())
+
+def _iter_html_rows(data: Buffer) -> Iterator[List[str]]:
     """
-    Lee la PRIMERA tabla de un HTML (muchos sistemas exportan HTML con extensión .xls).
+    Recorre la PRIMERA tabla del HTML con el parser incremental de lxml.
+    Produce un <tr> a la vez (lista de textos de sus celdas) y libera el
+    elemento apenas se lee, así la memoria no crece con el tamaño del export.
     """
+    encoding = _guess_encoding(data)
+    context = etree.iterparse(
+        _as_file(data),
+        events=("start", "end"),
+        tag=("table", "tr"),
+        html=True,
+        encoding=encoding,
+        huge_tree=True,
+    )
+    depth = 0
+    found_table = False
     try:
-        text = data.decode("utf-8")
-    except UnicodeDecodeError:
-        text = data.decode("latin-1", errors="ignore")
+        for event, el in context:
+            if el.tag == "table":
+                if event == "start":
+                    found_table = True
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        break  # cerró la primera tabla
+                continue
 
-    soup = BeautifulSoup(text, "lxml")
-    table = soup.find("table")
-    if not table:
-        raise ValueError("No se encontró <table> en el HTML exportado.")
+            if event == "start":
+                continue
 
-    trs = table.find_all("tr")
-    rows = []
-    for tr in trs:
-        cells = [c.get_text(strip=True) for c in (tr.find_all("td") or tr.find_all("th"))]
-        if cells:
-            rows.append(cells)
+            if depth > 0:
+                cells = [_cell_text(c) for c in (list(el.iter("td")) or list(el.iter("th")))]
+                if cells:
+                    yield cells
 
-    if not rows:
-        return [], []
+            # Libera el <tr> ya leído y los hermanos anteriores
+            el.clear(keep_tail=True)
+            parent = el.getparent()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+    finally:
+        del context
 
-    headers = _normalize_headers(rows[0])
-    body = [r for r in rows[1:] if any(x.strip() for x in r)]
-    return headers, body
+    if not found_table:
+        raise ValueError("No se encontró <table> en el HTML exportado.")
 
-def _read_xlsx(data: bytes) -> Tuple[List[str], List[List]]:
-    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
-    ws = wb.active
-    rows = [[(c if c is not None else "") for c in row] for row in ws.iter_rows(values_only=True)]
-    wb.close()
-    if not rows:
-        return [], []
-    headers = _normalize_headers(rows[0])
-    body = [r for r in rows[1:] if any(str(x).strip() for x in r)]
+def _split_header(rows: Iterable[List]) -> Tuple[List[str], Iterator[List]]:
+    """
+    Primera fila = encabezados. El cuerpo se devuelve como generador (sin filas
+    totalmente vacías), así nadie arma la lista completa del export en memoria.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    headers = _normalize_headers(first)
+    body = (r for r in rows if any(str(x).strip() for x in r))
     return headers, body
 
-def _read_xls(data: bytes) -> Tuple[List[str], List[List]]:
-    # Muchos “.xls” de sistemas realmente son HTML; detecta eso primero
-    head = data[:256].lower()
-    if b"<html" in head or b"<table" in head:
-        return _read_html_table(data)
-
-    book = xlrd.open_workbook(file_contents=data)
-    sh = book.sheet_by_index(0)
-    rows = []
-    for rx in range(sh.nrows):
-        row = []
-        for cx in range(sh.ncols):
-            v = sh.cell_value(rx, cx)
-            row.append(v)
-        rows.append(row)
-
-    if not rows:
-        return [], []
-    headers = _normalize_headers(rows[0])
-    body = [r for r in rows[1:] if any(str(x).strip() for x in r)]
-    return headers, body
+def _iter_xlsx_rows(data: Buffer) -> Iterator[List]:
+    wb = load_workbook(_as_file(data), read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        for row in ws.iter_rows(values_only=True):
+            yield [(c if c is not None else "") for c in row]
+    finally:
+        wb.close()
 
-def _detect_and_read(data: bytes, name: str) -> Tuple[List[str], List[List]]:
-    low = data[:4096].lower()
-    if b"<html" in low or b"<table" in low or b"<form" in low:
-        return _read_html_table(data)
+def _iter_xls_rows(data: Buffer) -> Iterator[List]:
+    """
+    BIFF real con xlrd. on_demand=True: solo se carga la hoja 0 (no todo el
+    libro); cada fila sale completa con row_values() y el libro se libera en
+    cuanto se consume la hoja. Si `data` es el mmap de _open_source,
+    release_resources() lo cierra; el with de _open_source lo tolera.
+    """
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    try:
+        sh = book.sheet_by_index(0)
+        row_values = sh.row_values
+        for rx in range(sh.nrows):
+            yield row_values(rx)
+    finally:
+        book.unload_sheet(0)
+        book.release_resources()
 
-    if name.endswith(".xlsx") or data[:2] == b"PK":
-        return _read_xlsx(data)
-    # por defecto intenta xls (y dentro detecta html camuflado)
-    return _read_xls(data)
+# CSV/TSV: si el sistema puede exportar texto plano, es lo más barato de parsear
+_CSV_DELIMITERS = (",", ";", "\t", "|")
 
-# -------------------- Proceso e inserción --------------------
+def _csv_delimiter(head: bytes, name: str) -> str:
+    # El separador que más aparece en la primera línea (.tsv siempre es tab)
+    if name.endswith(".tsv"):
+        return "\t"
+    first = head.split(b"\n", 1)[0]
+    return max(_CSV_DELIMITERS, key=lambda d: first.count(d.encode()))
 
-def process_spreadsheet(data: bytes, suggested_name: str, system_code: str, store_id: int, colmap: Dict[str, str]) -> int:
-    headers, rows = _detect_and_read(data, suggested_name)
-    idx = {h: i for i, h in enumerate(headers)}
+def _iter_csv_rows(data: Buffer, name: str = "") -> Iterator[List[str]]:
+    """
+    CSV/TSV con el módulo csv sobre un TextIOWrapper: se decodifica y parsea
+    por bloques, sin armar una copia str del archivo.
+    """
+    encoding = _guess_encoding(data)
+    if encoding == "utf-8":
+        encoding = "utf-8-sig"  # Excel agrega BOM al guardar como CSV UTF-8
+    delimiter = _csv_delimiter(bytes(data[:SNIFF_BYTES]), name)
+    text = io.TextIOWrapper(_as_file(data), encoding=encoding, newline="")
+    try:
+        for row in csv.reader(text, delimiter=delimiter):
+            yield [c.strip() for c in row]
+    finally:
+        text.detach()  # no cierra el mmap/BytesIO de abajo
 
-    # Normaliza el mapeo a minúsculas (coincide con headers ya normalizados)
-    colmap = {k: str(v).strip().lower() for k, v in colmap.items()}
+# -------------------- Registro de lectores --------------------
 
-    # valida columnas requeridas
-    for k, colname in colmap.items():
-        if colname not in idx:
-            raise RuntimeError(f"Columna '{colname}' no encontrada en el archivo. Encabezados: {headers}")
+# Bytes del inicio del export que se miran para decidir el formato (una sola vez).
+# Los HTML “estilo Excel” traen BOM, <meta> y un <style> largo antes de <table>
+SNIFF_BYTES = 4096
 
-    run_id = begin_ingestion_run(system_code, store_id)
-    total = 0
+class ExportReader(NamedTuple):
+    name: str
+    # sniff(head, nombre) -> bool: head son los primeros SNIFF_BYTES del export
+    # y nombre el nombre sugerido en minúsculas
+    sniff: Callable[[bytes, str], bool]
+    # iter_rows(data, nombre) -> filas (listas), la primera son los encabezados
+    iter_rows: Callable[[Buffer, str], Iterable[List]]
 
-    raw_rows = []
-    current_rows = []
+_READERS: List[ExportReader] = []
 
+def register_reader(name: str, sniff: Callable[[bytes, str], bool],
+                    iter_rows: Callable[[Buffer, str], Iterable[List]], first: bool = True):
+    """
+    Registra un lector de exports. Un sistema nuevo lo llama desde su propio
+    scraper (no hace falta tocar este módulo); por defecto queda antes de los
+    incluidos, así puede reclamar formatos que ellos también reconocerían.
+    Registrar otra vez un nombre reemplaza el lector anterior.
+    """
+    _READERS[:] = [r for r in _READERS if r.name != name]
+    reader = ExportReader(name, sniff, iter_rows)
+    if first:
+        _READERS.insert(0, reader)
+    else:
+        _READERS.append(reader)
+
+_OLE2_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"  # contenedor de los .xls BIFF8
+_ZIP_MAGIC = b"PK\x03\x04"                           # .xlsx (OOXML es un zip)
+_HTML_RE = re.compile(rb"<\s*(?:html|head|meta|style|table|form|!doctype\s+html)\b", re.IGNORECASE)
+
+def _looks_like_csv(head: bytes, name: str) -> bool:
+    if name.endswith((".csv", ".tsv")):
+        return True
+    # Texto plano (sin NUL ni etiquetas) con algún separador en la primera línea
+    if not head or b"\x00" in head or b"<" in head:
+        return False
+    first = head.split(b"\n", 1)[0]
+    return any(d.encode() in first for d in _CSV_DELIMITERS)
+
+# Incluidos, en orden: primero las firmas binarias (inequívocas), luego texto.
+# Muchos “.xls” de los sistemas realmente son HTML: lo decide el contenido, no la extensión.
+register_reader("xls", lambda head, name: head.startswith(_OLE2_MAGIC),
+                lambda data, name: _iter_xls_rows(data), first=False)
+register_reader("xlsx", lambda head, name: head.startswith(_ZIP_MAGIC),
+                lambda data, name: _iter_xlsx_rows(data), first=False)
+register_reader("html", lambda head, name: _HTML_RE.search(head) is not None,
+                lambda data, name: _iter_html_rows(data), first=False)
+register_reader("csv", _looks_like_csv, _iter_csv_rows, first=False)
+
+def _sniff_reader(data: Buffer, name: str) -> ExportReader:
+    head = bytes(data[:SNIFF_BYTES])
+    name = (name or "").lower()
+    for reader in _READERS:
+        if reader.sniff(head, name):
+            return reader
+    # Sin firma reconocida: xlrd (también abre BIFF2-5 sueltos y da un error claro)
+    return next(r for r in _READERS if r.name == "xls")
+
+def _detect_and_read(data: Buffer, name: str) -> Tuple[List[str], Iterator[List]]:
+    """
+    Devuelve (encabezados, generador de filas). El formato se decide una sola
+    vez mirando los primeros SNIFF_BYTES; las filas se leen a medida que se
+    consumen.
+    """
+    reader = _sniff_reader(data, name)
+    return _split_header(reader.iter_rows(data, (name or "").lower()))
+
+# -------------------- Pipeline: filas → normalizar → convertir → BD --------------------
+
+# Filas por lote que se convierten y se mandan a la BD (INGEST_CHUNK_SIZE en .env)
+DEFAULT_CHUNK_SIZE = 5000
+
+FIELDS = ("system_id", "sku", "name", "existencia", "costo", "precio")
+
+def _normalize_rows(rows: Iterable[List], idx: Dict[str, int], colmap: Dict[str, str]) -> Iterator[tuple]:
+    """
+    Toma solo las columnas mapeadas de cada fila:
+    (rownum, system_id, sku, name, existencia, costo, precio), con los textos ya limpios
+    y los numéricos todavía crudos.
+    """
+    i_sid, i_sku, i_name, i_exist, i_costo, i_precio = (idx[colmap[k]] for k in FIELDS)
     for i, r in enumerate(rows, start=1):
-        system_id = txt(r[idx[colmap["system_id"]]])
-        sku       = txt(r[idx[colmap["sku"]]])
-        name      = txt(r[idx[colmap["name"]]])
-        existencia= to_int_loose(r[idx[colmap["existencia"]]])
-        costo     = parse_price(r[idx[colmap["costo"]]])
-        precio    = parse_price(r[idx[colmap["precio"]]])
-
-        # Acumula crudo (incluye duplicados)
+        yield (
+            i,
+            txt(r[i_sid]),
+            txt(r[i_sku]),
+            txt(r[i_name]),
+            r[i_exist],
+            r[i_costo],
+            r[i_precio],
+        )
+
+def _chunked(rows: Iterable, size: int) -> Iterator[list]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _convert_chunk(chunk: List[tuple], system_code: str, store_id: int) -> Tuple[List[dict], List[dict]]:
+    """
+    Convierte un lote normalizado a las filas de inventory_raw (incluye duplicados
+    y filas sin Id) y de inventory_current (solo filas con system_id).
+    Los numéricos se convierten por columna (todo el lote de una vez).
+    """
+    rownums, system_ids, skus, names, existencias, costos, precios = zip(*chunk)
+    existencias = to_int_loose_column(existencias)
+    costos      = parse_price_column(costos)
+    precios     = parse_price_column(precios)
+
+    raw_rows = []
+    current_rows = []
+    for i, system_id, sku, name, existencia, costo, precio in zip(
+            rownums, system_ids, skus, names, existencias, costos, precios):
         raw_rows.append(dict(
             system_code=system_code,
             store_id=store_id,
@@ -144,12 +384,584 @@ def process_spreadsheet(data: bytes, suggested_name: str, system_code: str, stor
                 precio=precio,
                 seen_at=None,
             ))
-            total += 1
+    return raw_rows, current_rows
+
+def _write_chunk(writer: InventoryWriter, raw_rows: List[dict], current_rows: List[dict],
+                 staging: bool = False):
+    # Misma conexión y transacción para toda la tienda; INSERT multi-fila por lotes
+    writer.insert_raw(raw_rows)
+    if staging:
+        writer.upsert_staging(current_rows)
+    else:
+        writer.upsert_current(current_rows)
+
+# -------------------- Modo delta para inventory_current --------------------
+
+_CENT = Decimal("0.01")
+
+def _money(v):
+    # Igual que lo guarda DECIMAL(16,2), para comparar con lo que devuelve la BD
+    return None if v is None else Decimal(repr(v)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+def _state_key(row: dict) -> tuple:
+    # Mismo orden que load_inventory_current(): (sku, name, existencia, costo, precio)
+    return (row["sku"], row["name"], row["existencia"], _money(row["costo"]), _money(row["precio"]))
+
+class _CurrentDelta:
+    """
+    Carga una sola vez el estado previo de la tienda/sistema y, lote a lote,
+    deja pasar solo las filas nuevas o que cambiaron (por system_id). Al final
+    borra las que ya no vienen en el export. Los cambios quedan además en
+    `history` para inventory_history.
+    """
+
+    def __init__(self, system_code: str, store_id: int):
+        self.system_code = system_code
+        self.store_id = store_id
+        self.state = load_inventory_current(system_code, store_id)
+        self.missing = set(self.state)
+        self.inserted = self.changed = self.unchanged = self.deleted = 0
+        self.history: List[dict] = []
+        # SKU anterior de las filas que cambiaron de SKU (para product_summary)
+        self.moved_skus = set()
+
+    def filter(self, rows: List[dict]) -> List[dict]:
+        out = []
+        for r in rows:
+            sid = r["system_id"]
+            key = _state_key(r)
+            old = self.state.get(sid)
+            if old is None:
+                self.inserted += 1
+                out.append(r)
+                self.history.append(dict(r, change_type="new"))
+            elif old != key:
+                self.changed += 1
+                out.append(r)
+                self.history.append(dict(r, change_type="changed"))
+                if old[0] is not None and old[0] != r["sku"]:
+                    self.moved_skus.add(old[0])
+            else:
+                self.unchanged += 1
+            self.state[sid] = key
+            self.missing.discard(sid)
+        return out
+
+    def pop_history(self) -> List[dict]:
+        rows, self.history = self.history, []
+        return rows
+
+    def finish(self, writer: InventoryWriter, delete: bool = True) -> int:
+        """
+        Registra en el historial las filas que ya no vienen y (con `delete`)
+        las borra. Sin `delete` (modo full) de eso se encarga
+        el upsert completo y el barrido por run_id. Devuelve las filas de historial.
+        """
+        gone = [dict(system_code=self.system_code, store_id=self.store_id, system_id=sid,
+                     sku=old[0], name=old[1], existencia=old[2], costo=old[3], precio=old[4],
+                     change_type="deleted")
+                for sid in self.missing for old in (self.state[sid],)]
+        n = writer.insert_history(self.pop_history() + gone)
+        if not delete:
+            self.deleted = len(gone)
+            return n
+        if self.missing:
+            self.deleted = writer.delete_current(self.system_code, self.store_id, self.missing)
+        # Las filas sin cambios no se tocan: cuándo se vio la tienda por última
+        # vez queda en ingest_export_cache.updated_at (save_export_hash)
+        return n
+
+    def counts(self) -> dict:
+        return dict(inserted=self.inserted, changed=self.changed,
+                    unchanged=self.unchanged, deleted=self.deleted)
+
+def format_summary(summary: dict) -> str:
+    """Texto corto del resumen que devuelve process_spreadsheet()."""
+    text = f"{summary['total']} filas procesadas"
+    if summary.get("cached"):
+        return text + " (export sin cambios)"
+    if "inserted" in summary:
+        text += (f" (nuevas {summary['inserted']}, cambiadas {summary['changed']}, "
+                 f"sin cambios {summary['unchanged']}, borradas {summary['deleted']})")
+    if summary.get("swept"):
+        text += f", barridas {summary['swept']} de corridas anteriores"
+    if "history" in summary:
+        text += f", {summary['history']} al historial"
+    if summary.get("summary_skus"):
+        text += f", {summary['summary_skus']} SKUs recalculados en product_summary"
+    if "publish_ms" in summary:
+        text += f", publicado en {summary['publish_ms']:.0f} ms"
+    if summary.get("queue_wait_ms", 0) >= 1:
+        text += f", el parseo esperó {summary['queue_wait_ms']:.0f} ms a la BD"
+    if summary.get("rows_per_sec"):
+        text += f", {summary['rows_per_sec']:,.0f} filas/s en la BD"
+    if "checkouts" in summary:
+        text += f", conexiones BD: {summary['connections']} nuevas / {summary['checkouts']} del pool"
+    return text
+
+# -------------------- Proceso e inserción --------------------
+
+# Súbelo al cambiar cómo se leen o convierten los exports: invalida la caché
+# por sha256 y la próxima corrida reingiere aunque el archivo sea el mismo
+PARSER_VERSION = 1
+
+def _content_hash(data: Buffer, colmap: Dict[str, str]) -> str:
+    # sha256 de la versión del parser, el mapeo de columnas y el export; el
+    # buffer/mmap se lee directo (sin copiarlo)
+    h = hashlib.sha256(f"parser={PARSER_VERSION}\n".encode())
+    for key, col in sorted(colmap.items()):
+        h.update(f"{key}={str(col).strip().lower()}\n".encode())
+    with memoryview(data) as view:
+        h.update(view)
+    return h.hexdigest()
+
+# Cómo se escribe inventory_current (INGEST_MODE en .env):
+#   delta   = solo filas nuevas/cambiadas/borradas, comparando en Python (default)
+#   full    = upsert de todas las filas del export (compara igual, solo para el historial)
+#   staging = todo a inventory_current_staging y luego se publica con una
+#             transacción corta (la API nunca ve un export a medio escribir)
+INGEST_MODES = ("delta", "full", "staging")
+
+def _ingest_options(chunk_size: int = None, force: bool = None, delta: bool = None,
+                    mode: str = None) -> Tuple[int, bool, str]:
+    # Lo que no venga explícito sale del .env (INGEST_CHUNK_SIZE / INGEST_FORCE / INGEST_MODE)
+    chunk_size = chunk_size or int(os.getenv("INGEST_CHUNK_SIZE") or DEFAULT_CHUNK_SIZE)
+    if force is None:
+        force = os.getenv("INGEST_FORCE") == "1"
+    if mode is None:
+        if delta is not None:
+            mode = "delta" if delta else "full"
+        else:
+            # INGEST_DELTA=0 (anterior a INGEST_MODE) sigue significando full
+            mode = os.getenv("INGEST_MODE") or ("delta" if (os.getenv("INGEST_DELTA") or "1") == "1" else "full")
+    if mode not in INGEST_MODES:
+        raise ValueError(f"INGEST_MODE inválido: {mode!r} (usa {', '.join(INGEST_MODES)})")
+    return chunk_size, force, mode
+
+def _skip_cached(system_code: str, store_id: int, content_hash: str, total: int) -> dict:
+    touch_export_hash(system_code, store_id)
+    print(f"[{system_code}] tienda {store_id}: export sin cambios (sha256 {content_hash[:12]}), se omite la ingesta")
+    return dict(total=total, cached=True)
+
+def process_spreadsheet(source: Union[Buffer, str, os.PathLike], suggested_name: str, system_code: str,
+                        store_id: int, colmap: Dict[str, str], chunk_size: int = None,
+                        force: bool = None, delta: bool = None, mode: str = None) -> dict:
+    """
+    Lee el export y lo escribe en la BD por lotes de `chunk_size` filas mientras
+    se sigue parseando: la memoria queda acotada al tamaño del lote.
+
+    `source` puede ser bytes, un mmap o la ruta del archivo descargado (se mapea
+    en memoria en vez de leerlo completo).
+
+    Si el export es idéntico (mismo sha256, que incluye COLMAP y
+    PARSER_VERSION) al último ingerido para esa tienda/sistema no se parsea:
+    solo se marca la tienda como vista (touch_export_hash). `force=True` (o
+    INGEST_FORCE=1) reingiere de todas formas.
+
+    `mode` (o INGEST_MODE) elige cómo se escribe inventory_current: "delta"
+    (default; solo filas nuevas, cambiadas o borradas), "full" o "staging"
+    (ver INGEST_MODES). `delta=True/False` equivale a "delta"/"full".
+
+    Devuelve el resumen de la corrida: total y, en delta/staging, cuántas filas
+    fueron nuevas/cambiadas/sin cambios/borradas (ver format_summary).
+
+    El parseo corre en el hilo que llama y la escritura en un hilo escritor
+    (WriteBehind, INGEST_QUEUE_DEPTH lotes en cola); vuelve cuando la tienda
+    quedó escrita. Los scrapers usan ExportPipeline para parsear en otro
+    proceso mientras el navegador sigue descargando.
+    """
+    chunk_size, force, mode = _ingest_options(chunk_size, force, delta, mode)
+
+    with _open_source(source) as data:
+        content_hash = _content_hash(data, colmap)
+        cached = None if force else get_export_hash(system_code, store_id)
+        if cached and cached[0] == content_hash:
+            return _skip_cached(system_code, store_id, content_hash, cached[1])
+
+        chunks = _convert_export(data, suggested_name, system_code, store_id, colmap, chunk_size)
+        return _write_behind(chunks, system_code, store_id, content_hash, mode)
+
+def _convert_export(data: Buffer, suggested_name: str, system_code: str, store_id: int,
+                    colmap: Dict[str, str], chunk_size: int) -> Iterator[Tuple[List[dict], List[dict]]]:
+    """
+    Valida los encabezados (antes de tocar la BD) y devuelve el generador de
+    lotes ya convertidos: (filas de inventory_raw, filas de inventory_current).
+    No usa la BD, así que puede correr en un proceso aparte.
+    """
+    headers, rows = _detect_and_read(data, suggested_name)
+    idx = {h: i for i, h in enumerate(headers)}
+
+    # Normaliza el mapeo a minúsculas (coincide con headers ya normalizados)
+    colmap = {k: str(v).strip().lower() for k, v in colmap.items()}
+
+    # valida columnas requeridas
+    for k, colname in colmap.items():
+        if colname not in idx:
+            raise RuntimeError(f"Columna '{colname}' no encontrada en el archivo. Encabezados: {headers}")
+
+    return (_convert_chunk(chunk, system_code, store_id)
+            for chunk in _chunked(_normalize_rows(rows, idx, colmap), chunk_size))
+
+def _write_export(chunks: Iterable[Tuple[List[dict], List[dict]]], system_code: str, store_id: int,
+                  content_hash: str, mode: str, snapshot: bool = None) -> dict:
+    """
+    Escribe en la BD los lotes convertidos y guarda el sha256 del export.
+    Con `snapshot` (INGEST_SNAPSHOTS=1 por defecto) deja además el export
+    parseado en un snapshot columnar (export_snapshots.py) para reprocesarlo.
+    """
+    if snapshot is None:
+        snapshot = (os.getenv("INGEST_SNAPSHOTS") or "1") == "1"
+
+    conn_before = connection_stats()
+    run_id = begin_ingestion_run(system_code, store_id, mode, content_hash)
+    try:
+        summary, snap = _write_run(chunks, system_code, store_id, content_hash, mode, run_id, snapshot)
+    except Exception as e:
+        # La transacción ya hizo rollback; la corrida queda registrada como fallida
+        if run_id:
+            fail_ingestion_run(run_id, e)
+        raise
+    summary["run_id"] = run_id
+
+    # Conexiones físicas nuevas y préstamos del pool durante la escritura (del
+    # proceso: con varias ingestas en paralelo incluye las de las otras)
+    conn_after = connection_stats()
+    summary["connections"] = conn_after["connects"] - conn_before["connects"]
+    summary["checkouts"] = conn_after["checkouts"] - conn_before["checkouts"]
+
+    if snap:
+        _save_snapshot(snap, run_id, summary)
+    return summary
+
+_QUEUE_DONE = object()
+
+class WriteBehind:
+    """
+    Cola acotada entre el parseo y la BD para una tienda/sistema. El que
+    parsea hace push() de cada lote; un hilo escritor, dueño de la conexión,
+    los va escribiendo con _write_export (misma transacción y resumen). Con
+    la cola llena push() espera (backpressure: la memoria no crece si la BD
+    va más lenta que el parseo).
+
+    flush() cierra la cola, espera a que todo quede escrito y devuelve el
+    resumen (o relanza el error del escritor): hasta entonces la corrida
+    sigue 'running' en ingestion_runs. abort(exc) descarta la corrida.
+    """
+
+    def __init__(self, system_code: str, store_id: int, content_hash: str, mode: str,
+                 depth: int = None, snapshot: bool = None):
+        depth = depth or int(os.getenv("INGEST_QUEUE_DEPTH") or 4)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=depth)
+        self._summary = None
+        self._error = None
+        self.wait_secs = 0.0  # tiempo que el parseo esperó a la BD
+        self._thread = threading.Thread(
+            target=self._run, args=(system_code, store_id, content_hash, mode, snapshot),
+            name=f"db-writer-{system_code}-{store_id}", daemon=True,
+        )
+        self._thread.start()
+
+    def _drain(self) -> Iterator[Tuple[List[dict], List[dict]]]:
+        while True:
+            item = self._queue.get()
+            if item is _QUEUE_DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item  # dentro de la transacción: rollback y corrida 'error'
+            yield item
+
+    def _run(self, system_code, store_id, content_hash, mode, snapshot):
+        try:
+            self._summary = _write_export(self._drain(), system_code, store_id, content_hash, mode, snapshot)
+        except BaseException as e:
+            self._error = e
+
+    def _put(self, item):
+        t0 = time.perf_counter()
+        while True:
+            try:
+                self._queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                # El escritor murió con la cola llena: nadie la va a vaciar
+                if not self._thread.is_alive():
+                    raise self._error or RuntimeError("el hilo escritor terminó antes de tiempo")
+        self.wait_secs += time.perf_counter() - t0
+
+    def push(self, raw_rows: List[dict], current_rows: List[dict]):
+        if self._error is not None:
+            raise self._error
+        self._put((raw_rows, current_rows))
+
+    def flush(self) -> dict:
+        if self._thread.is_alive():
+            self._put(_QUEUE_DONE)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+        self._summary["queue_wait_ms"] = self.wait_secs * 1000
+        return self._summary
+
+    def abort(self, exc: BaseException):
+        if self._thread.is_alive():
+            with contextlib.suppress(BaseException):
+                self._put(exc)
+            self._thread.join()
+
+def _write_behind(chunks: Iterable[Tuple[List[dict], List[dict]]], system_code: str, store_id: int,
+                  content_hash: str, mode: str) -> dict:
+    # INGEST_QUEUE_DEPTH=0: sin hilo escritor, parseo y escritura en serie
+    if int(os.getenv("INGEST_QUEUE_DEPTH") or 4) <= 0:
+        return _write_export(chunks, system_code, store_id, content_hash, mode)
+    writer = WriteBehind(system_code, store_id, content_hash, mode)
+    try:
+        for raw_rows, current_rows in chunks:
+            writer.push(raw_rows, current_rows)
+    except BaseException as e:
+        writer.abort(e)
+        raise
+    return writer.flush()
+
+def _write_run(chunks, system_code: str, store_id: int, content_hash: str, mode: str,
+               run_id: int, snapshot: bool):
+    staging = mode == "staging"
+    # En full el tracker solo sirve para el historial: se escriben todas las filas igual
+    tracker = _CurrentDelta(system_code, store_id) if not staging else None
+    snap = SnapshotWriter(system_code, store_id, content_hash) if snapshot else None
+    raw_dump = (os.getenv("INGEST_RAW_DUMP") or "0") == "1"
+    total = history = 0
+
+    # Una conexión y una transacción para el inventario: si algo falla, rollback y la
+    # tienda queda como estaba (incluido el hash, así la próxima corrida reintenta).
+    # Cada fila escrita en inventory_current queda marcada con run_id
+    with InventoryWriter(raw_loader=os.getenv("INGEST_RAW_LOADER") or "insert",
+                         on_chunk=_chunk_logger(system_code, store_id), run_id=run_id) as writer:
+        # Solo ahora (hay datos nuevos) se limpia el dump crudo de esta tienda/sistema
+        if raw_dump:
+            writer.clear_raw(system_code, store_id)
+        if staging:
+            writer.clear_staging(system_code, store_id)
+
+        for raw_rows, current_rows in chunks:
+            if snap:
+                try:
+                    snap.add(raw_rows, current_rows)
+                except (OverflowError, ValueError) as e:
+                    # El snapshot es opcional: un valor fuera de rango no frena la ingesta
+                    print(f"[{system_code}] tienda {store_id}: sin snapshot ({e})")
+                    snap = None
+            total += len(current_rows)
+            if tracker:
+                changed = tracker.filter(current_rows)
+                history += writer.insert_history(tracker.pop_history())
+                if mode == "delta":
+                    current_rows = changed
+            _write_chunk(writer, raw_rows if raw_dump else (), current_rows, staging)
+
+        summary = dict(total=total)
+        if tracker:
+            history += tracker.finish(writer, delete=mode == "delta")
+            summary.update(tracker.counts())
+
+        summary["rows_per_sec"] = writer.rows_per_sec()
+
+        # SKUs a recalcular en product_summary además de los del historial
+        touched = set(tracker.moved_skus) if tracker else set()
+        if staging:
+            # Lo pesado (raw + staging) se confirma sin tocar inventory_current;
+            # la publicación es otra transacción, corta
+            history = writer.history_from_staging(system_code, store_id)
+            touched |= writer.staging_moved_skus(system_code, store_id)
+            writer.commit()
+            t0 = time.perf_counter()
+            counts = writer.publish_staging(system_code, store_id)
+            writer.save_export_hash(system_code, store_id, content_hash, total)
+            writer.commit()
+            summary["publish_ms"] = (time.perf_counter() - t0) * 1000
+            counts["unchanged"] = total - counts["inserted"] - counts["changed"]
+            summary.update(counts)
+            # Fuera de la publicación: vaciar el staging
+            writer.clear_staging(system_code, store_id)
+        else:
+            writer.save_export_hash(system_code, store_id, content_hash, total)
+
+        # Barrido por generación, solo en full: el upsert marcó todas las filas
+        # del export y lo que quedó con otra corrida ya no está. Delta y staging
+        # borran lo que falta ellos mismos y no reescriben las filas sin cambios
+        sweep = mode == "full"
+        touched |= writer.summary_skus(system_code, store_id, sweep)
+        summary["swept"] = writer.sweep_current(system_code, store_id) if sweep else 0
+        summary["history"] = history
+        writer.commit()
+
+        # product_summary va después del commit, en transacciones propias y
+        # cortas (ver refresh_summary): /products puede ver el resumen anterior
+        # por un momento. Si falla, el inventario ya quedó confirmado
+        try:
+            summary["summary_skus"] = writer.refresh_summary(touched)
+        except Exception as e:
+            print(f"⚠️ [{system_code}] tienda {store_id}: no se pudo actualizar product_summary ({e}); "
+                  f"corre rebuild_summary.py")
+            summary["summary_skus"] = None
+        # Al final: la caché de /products y el índice de búsqueda se rearman
+        # cuando aparece la corrida 'ok', ya con el resumen al día
+        writer.finish_run(total, summary["swept"])
+
+    return summary, snap
+
+def _chunk_logger(system_code: str, store_id: int):
+    # INGEST_VERBOSE=1: una línea por sentencia con las filas/s de ese lote
+    if os.getenv("INGEST_VERBOSE") != "1":
+        return None
+    def log(table: str, rows: int, secs: float):
+        rate = rows / secs if secs else 0.0
+        print(f"[{system_code}] tienda {store_id}: {table} {rows} filas en {secs * 1000:.0f} ms ({rate:,.0f} filas/s)")
+    return log
+
+def _save_snapshot(snap: SnapshotWriter, run_id, summary: dict):
+    try:
+        run = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        run = f"{run}-{run_id}" if run_id else f"{run}-{(snap.content_hash or '')[:12]}"
+        summary["snapshot"] = snap.save(run)
+        prune_snapshots(snap.system_code, snap.store_id, int(os.getenv("INGEST_SNAPSHOT_KEEP") or 10))
+    except OSError as e:
+        print(f"[{snap.system_code}] tienda {snap.store_id}: no se pudo guardar el snapshot ({e})")
+
+def replay_snapshot(path: str, delta: bool = None, chunk_size: int = None, mode: str = None) -> dict:
+    """
+    Vuelve a escribir en la BD un export desde su snapshot (sin navegador ni
+    parseo). Siempre escribe (no mira la caché por sha256) y no genera otro
+    snapshot.
+    """
+    chunk_size, _, mode = _ingest_options(chunk_size, True, delta, mode)
+    with load_snapshot(path) as snap:
+        meta = snap.meta
+        return _write_export(snap.iter_chunks(chunk_size), meta["system_code"], meta["store_id"],
+                             meta["content_hash"], mode, snapshot=False)
+
+# -------------------- Pipeline de los scrapers: parseo en procesos, un escritor --------------------
+
+def parse_to_spool(source: Union[str, os.PathLike], suggested_name: str, system_code: str, store_id: int,
+                   colmap: Dict[str, str], chunk_size: int, skip_hash: str = None) -> dict:
+    """
+    Corre en un proceso del pool: parsea y convierte el export y deja los lotes
+    (pickle, uno tras otro) en un archivo temporal que luego lee el escritor.
+    Así el proceso no devuelve todo el export de una vez por el pipe.
+
+    Si el sha256 coincide con `skip_hash` (último ingerido) no se parsea.
+    """
+    with _open_source(source) as data:
+        content_hash = _content_hash(data, colmap)
+        if content_hash == skip_hash:
+            return dict(hash=content_hash, spool=None)
+
+        chunks = _convert_export(data, suggested_name, system_code, store_id, colmap, chunk_size)
+        fd, spool = tempfile.mkstemp(prefix=f"{system_code}-{store_id}-", suffix=".chunks")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException:
+            os.remove(spool)
+            raise
+    return dict(hash=content_hash, spool=spool)
+
+def _read_spool(path: str) -> Iterator[Tuple[List[dict], List[dict]]]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+class ExportPipeline:
+    """
+    Para los scrapers: mientras el navegador descarga el reporte de la
+    siguiente bodega, el anterior se parsea en un pool de procesos y se
+    escribe en la BD desde un único hilo escritor (las escrituras de todas las
+    bodegas van en serie, sin competir por la BD ni bloquear el loop de asyncio).
+
+        async with ExportPipeline() as pipeline:
+            for ...:
+                path, fname = await download_report(...)
+                pipeline.submit(path, fname, SYSTEM_CODE, store_id, COLMAP, label=bodega)
+            summaries = await pipeline.results()
+
+    Los archivos descargados se borran apenas termina su parseo. Ojo: Playwright
+    borra las descargas al cerrar el contexto, así que hay que esperar
+    results() antes de ctx.close().
+    """
+
+    def __init__(self, workers: int = None, chunk_size: int = None,
+                 force: bool = None, delta: bool = None, mode: str = None):
+        self.chunk_size, self.force, self.mode = _ingest_options(chunk_size, force, delta, mode)
+        workers = workers or int(os.getenv("INGEST_PARSE_WORKERS") or 2)
+        # spawn: el proceso del scraper ya tiene hilos (Playwright); fork con hilos no es seguro
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._tasks: List[Tuple[str, "asyncio.Task"]] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def submit(self, path: Union[str, os.PathLike], suggested_name: str, system_code: str,
+               store_id: int, colmap: Dict[str, str], label: str = None) -> "asyncio.Task":
+        task = asyncio.ensure_future(self._process(path, suggested_name, system_code, store_id, colmap))
+        self._tasks.append((label or str(store_id), task))
+        return task
+
+    async def _process(self, path, suggested_name, system_code, store_id, colmap) -> dict:
+        loop = asyncio.get_running_loop()
+        try:
+            cached = None
+            if not self.force:
+                # En el pool general, no en el escritor: si no, espera la escritura
+                # de la bodega anterior y el parseo de esta ya no se solapa con ella
+                cached = await run_db(get_export_hash, system_code, store_id)
+            parsed = await loop.run_in_executor(
+                self._pool, parse_to_spool, os.fspath(path), suggested_name, system_code, store_id,
+                colmap, self.chunk_size, cached[0] if cached else None,
+            )
+        finally:
+            with contextlib.suppress(Exception):
+                os.remove(path)
+
+        if parsed["spool"] is None:
+            return await loop.run_in_executor(
+                self._writer, _skip_cached, system_code, store_id, parsed["hash"], cached[1])
+        return await loop.run_in_executor(self._writer, self._write_spool, parsed, system_code, store_id)
+
+    def _write_spool(self, parsed: dict, system_code: str, store_id: int) -> dict:
+        try:
+            return _write_export(_read_spool(parsed["spool"]), system_code, store_id, parsed["hash"], self.mode)
+        finally:
+            with contextlib.suppress(Exception):
+                os.remove(parsed["spool"])
+
+    async def results(self) -> List[Tuple[str, dict]]:
+        """
+        Espera todas las bodegas enviadas, en el orden en que se enviaron.
+        Devuelve [(label, resumen)]; si alguna falló, se relanza su error
+        después de esperar a las demás.
+        """
+        tasks = self._tasks
+        self._tasks = []
+        outcomes = await asyncio.gather(*(t for _, t in tasks), return_exceptions=True)
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return [(label, summary) for (label, _), summary in zip(tasks, outcomes)]
 
-    # Inserciones en bloque para minimizar overhead de conexiones/roundtrips
-    if raw_rows:
-        bulk_insert_inventory_raw(raw_rows)
-    if current_rows:
-        bulk_upsert_inventory_current(current_rows)
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*(t for _, t in self._tasks), return_exceptions=True)
+        # shutdown(wait=True) bloquea: fuera del loop, que el otro sistema sigue corriendo
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown)
 
-    return total
+    def _shutdown(self):
+        self._pool.shutdown(wait=True)
+        self._writer.shutdown(wait=True)
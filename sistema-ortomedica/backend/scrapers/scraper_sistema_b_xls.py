@@ -1,14 +1,13 @@
 # scraper_sistema_b_generales.py
-import os, re, asyncio, tempfile, contextlib
+import os, re, asyncio, tempfile
 from dotenv import load_dotenv
 from playwright.async_api import async_playwright
-from db import ensure_tables, ensure_store
+from db import ensure_tables_async, ensure_store_async
 try:
-    from core_scraper_xls import process_spreadsheet
+    from core_scraper_xls import ExportPipeline, format_summary
 except Exception:
-    from scrapers.core_scraper_xls import process_spreadsheet
+    from scrapers.core_scraper_xls import ExportPipeline, format_summary
 
-from db import clear_store_inventory  # asegúrate de importarl
 # =================== Config ===================
 load_dotenv()
 
@@ -109,24 +108,20 @@ async def download_report(page):
     download = await dl.value
 
     suggested = download.suggested_filename or "reporte_b.xls"
+    # Se deja en disco: el pipeline lo mapea en memoria (en otro proceso) en vez de leerlo completo
     path = await download.path()
-    if path:
-        with open(path, "rb") as f:
-            return f.read(), suggested
-
-    # Fallback: save_as si el driver no expone path()
-    tmp = os.path.join(tempfile.gettempdir(), suggested)
-    await download.save_as(tmp)
-    with open(tmp, "rb") as f:
-        data = f.read()
-    with contextlib.suppress(Exception):
-        os.remove(tmp)
-    return data, suggested
+    if not path:
+        # Fallback: save_as si el driver no expone path(). Nombre único: con el
+        # pipeline el export anterior puede seguir parseándose mientras baja este
+        fd, path = tempfile.mkstemp(prefix=f"{SYSTEM_CODE}-", suffix=os.path.splitext(suggested)[1])
+        os.close(fd)
+        await download.save_as(path)
+    return path, suggested
 
 # =================== Main ===================
 async def main(debug: bool = False):
     # Ensure DB tables exist when running (defer from import time)
-    ensure_tables()
+    await ensure_tables_async()
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=not debug, slow_mo=400 if debug else 0)
         ctx = await browser.new_context(
@@ -142,17 +137,20 @@ async def main(debug: bool = False):
 
         await login(page)
 
-        # Iteramos igual para mantener compatibilidad con tu patrón
-        for bodega_name, store_id in BODEGAS.items():
-            ensure_store(store_id, bodega_name)
+        # El export de cada bodega se parsea en otro proceso (y se escribe en la BD
+        # desde un hilo escritor) mientras el navegador ya descarga la siguiente
+        async with ExportPipeline() as pipeline:
+            # Iteramos igual para mantener compatibilidad con tu patrón
+            for bodega_name, store_id in BODEGAS.items():
+                await ensure_store_async(store_id, bodega_name)
 
-            # limpiar previamente SOLO esta bodega de este sistema
-            clear_store_inventory(SYSTEM_CODE, store_id)
+                print(f"\n=== {SYSTEM_CODE} | Bodega: {bodega_name} ===")
+                path, fname = await download_report(page)
+                pipeline.submit(path, fname, SYSTEM_CODE, store_id, COLMAP, label=bodega_name)
 
-            print(f"\n=== {SYSTEM_CODE} | Bodega: {bodega_name} ===")
-            data, fname = await download_report(page)
-            total = process_spreadsheet(data, fname, SYSTEM_CODE, store_id, COLMAP)
-            print(f"[{SYSTEM_CODE}] {bodega_name} → {total} filas procesadas")
+            # Antes de cerrar el contexto: Playwright borra las descargas al cerrarlo
+            for bodega_name, summary in await pipeline.results():
+                print(f"[{SYSTEM_CODE}] {bodega_name} → {format_summary(summary)}")
 
         await ctx.close()
         await browser.close()
@@ -0,0 +1,216 @@
+# search_index.py
+"""
+Índice de trigramas en memoria para la búsqueda de /products (parámetro q).
+
+El catálogo son unas decenas de miles de SKUs: cabe de sobra en memoria, así
+que la API lo indexa al arrancar y resuelve qué SKUs coinciden sin ir a la
+BD; la BD solo se consulta para las ofertas de la página pedida.
+
+Cada SKU es un documento con su sku y sus nombres normalizados (minúsculas,
+sin tildes). Por cada trigrama y bigrama se guarda la lista de documentos
+que lo contienen en un array('I') ordenado. Los documentos van numerados en
+el orden de la lista (nombre, sku), así que los resultados salen ya
+ordenados para paginar.
+
+Una búsqueda intersecta las listas de los n-gramas de todas las palabras y,
+para las palabras de 4+ letras (sus trigramas podrían no estar seguidos),
+confirma cada candidato con "palabra in texto": misma semántica que el LIKE
+'%palabra%' de antes (todas las palabras, en el sku o en el nombre).
+
+SearchIndex arma el índice en un hilo y lo reemplaza entero cuando termina
+(las búsquedas en curso siguen con el anterior). Se reconstruye al terminar
+una ingesta lanzada por la API y, si las ingestas corren por fuera (cron),
+al ver una corrida nueva en ingestion_runs.
+"""
+import time
+import bisect
+import threading
+import unicodedata
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Separa sku y nombres en el texto del documento: ninguna palabra buscada lo contiene
+_SEP = "\x00"
+
+
+def normalize(text: str) -> str:
+    """Minúsculas y sin tildes, como compara la collation de MySQL."""
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def _grams(text: str, n: int):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _ngrams(text: str):
+    """Trigramas y bigramas (los bigramas resuelven las palabras de 2 letras: XL, 10...)."""
+    return _grams(text, 3) | _grams(text, 2)
+
+
+class TrigramIndex:
+    """Índice inmutable; se arma de una vez con las filas (sku, name) de inventory_current."""
+
+    def __init__(self, rows: Iterable[Tuple[str, str]]):
+        names: Dict[str, List[str]] = {}
+        for sku, name in rows:
+            if sku is None:
+                continue
+            names.setdefault(sku, [])
+            if name and name not in names[sku]:
+                names[sku].append(name)
+
+        # Orden de la lista: primer nombre (normalizado) y sku
+        docs = sorted(((normalize(min(n) if n else ""), sku, min(n) if n else "")
+                       for sku, n in names.items()))
+        self.keys: List[Tuple[str, str]] = [(k, sku) for k, sku, _ in docs]
+        self.skus: List[str] = [sku for _, sku, _ in docs]
+        self.names: List[str] = [name for _, _, name in docs]
+        self.texts: List[str] = [
+            _SEP.join([normalize(sku)] + [normalize(n) for n in names[sku]]) for sku in self.skus
+        ]
+        postings: Dict[str, array] = {}
+        for doc, text in enumerate(self.texts):
+            for gram in _ngrams(text):
+                p = postings.get(gram)
+                if p is None:
+                    p = postings[gram] = array("I")
+                p.append(doc)
+        self.postings = postings
+        # Vistas NumPy sobre los mismos arrays (sin copiar) para intersectar en C
+        self._np = {gram: np.frombuffer(p, dtype=np.uint32) for gram, p in postings.items()}
+
+    def __len__(self):
+        return len(self.skus)
+
+    def search(self, words: List[str]) -> List[int]:
+        """Documentos (en orden de lista) que contienen todas las palabras."""
+        words = [w for w in (normalize(w) for w in words) if w]
+        if not words:
+            return list(range(len(self.skus)))
+        lists, verify = [], []
+        for w in words:
+            n = min(len(w), 3)
+            if n < 2 or len(w) > 3:
+                # 1 letra: sin n-gramas. 4+: los trigramas pueden no estar seguidos
+                verify.append(w)
+            for gram in (_grams(w, n) if n >= 2 else ()):
+                p = self._np.get(gram)
+                if p is None:
+                    return []
+                lists.append(p)
+        if lists:
+            # Intersección de la más corta contra las demás (búsqueda binaria en C)
+            lists.sort(key=len)
+            cand = lists[0]
+            for p in lists[1:]:
+                if not len(cand):
+                    return []
+                pos = np.minimum(np.searchsorted(p, cand), len(p) - 1)
+                cand = cand[p[pos] == cand]
+            cand = cand.tolist()
+        else:
+            cand = range(len(self.skus))
+        texts = self.texts
+        for w in verify:
+            cand = [d for d in cand if w in texts[d]]
+        return list(cand)
+
+    def after(self, name: str, sku: str) -> int:
+        """Primer documento que va después de (name, sku) en la lista (para el cursor)."""
+        return bisect.bisect_right(self.keys, (normalize(name), sku or ""))
+
+    def memory_bytes(self) -> int:
+        """Aproximado: listas de n-gramas + textos normalizados."""
+        return (sum(p.itemsize * len(p) for p in self.postings.values())
+                + sum(len(t) for t in self.texts))
+
+
+class SearchIndex:
+    """
+    Índice vigente + reconstrucción en segundo plano. `loader()` devuelve las
+    filas (sku, name); `probe()` (opcional) un valor que cambia cuando termina
+    una ingesta, p. ej. la última corrida ok de ingestion_runs.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[Tuple[str, str]]],
+                 probe: Optional[Callable[[], object]] = None):
+        self.loader = loader
+        self.probe = probe
+        self.index: Optional[TrigramIndex] = None
+        self.built_at: Optional[float] = None
+        self.build_secs: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._running = False
+        self._again = False
+        self._seen = None
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    def rebuild(self):
+        """Arma un índice nuevo y lo publica; si falla se queda el anterior."""
+        t0 = time.perf_counter()
+        try:
+            seen = self.probe() if self.probe else None
+            index = TrigramIndex(self.loader())
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"⚠️ Índice de búsqueda: no se pudo reconstruir ({e})")
+            return
+        self.index = index
+        self._seen = seen
+        self.built_at = time.time()
+        self.build_secs = time.perf_counter() - t0
+        self.last_error = None
+
+    def rebuild_async(self):
+        """Reconstruye en un hilo; si ya hay una en curso, se repite una vez al terminar."""
+        with self._lock:
+            if self._running:
+                self._again = True
+                return
+            self._running = True
+        threading.Thread(target=self._rebuild_loop, name="search-index", daemon=True).start()
+
+    def _rebuild_loop(self):
+        while True:
+            self.rebuild()
+            with self._lock:
+                if not self._again:
+                    self._running = False
+                    return
+                self._again = False
+
+    def watch(self, interval: float):
+        """Hilo que consulta probe() cada `interval` segundos y reconstruye si cambió."""
+        if not self.probe or interval <= 0:
+            return
+
+        def _loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    seen = self.probe()
+                except Exception:
+                    continue
+                if seen != self._seen:
+                    self.rebuild_async()
+
+        threading.Thread(target=_loop, name="search-index-watch", daemon=True).start()
+
+    def stats(self) -> dict:
+        index = self.index
+        return dict(
+            ready=index is not None,
+            skus=len(index) if index else 0,
+            ngrams=len(index.postings) if index else 0,
+            memory_bytes=index.memory_bytes() if index else 0,
+            built_at=self.built_at,
+            build_secs=self.build_secs,
+            last_error=self.last_error,
+        )
@@ -0,0 +1,592 @@
+# storage.py
+"""
+Backends de almacenamiento detrás de db.py y de /products (api/main.py).
+
+    DB_BACKEND=mysql   (default) el servidor del .env (DB_HOST, DB_USER, ...)
+    DB_BACKEND=sqlite  un archivo local (SQLITE_PATH, default backend/ortomedica.db)
+
+En MySQL la búsqueda usa un índice FULLTEXT con el parser ngram sobre sku y
+names (todos los nombres del SKU) de product_summary. SQLite usa el mismo
+esquema, en modo WAL (la API lee mientras la ingesta escribe) y con un índice
+FTS5 (tokenizer trigram) sobre sku y names para la búsqueda de /products. Sirve para un despliegue chico, para una
+réplica de lectura junto a la API (sin ida y vuelta por red en cada
+consulta) y para correr benchmarks sin servidor MySQL.
+
+Cada backend entrega:
+  - connect(): conexión DB-API con la interfaz que usa el código
+    (cursor(dictionary=...), commit, rollback, close). Los parámetros van
+    siempre con %s / %(nombre)s, como en mysql-connector.
+  - sql: sentencias que reemplazan a las de db.py cuando el dialecto cambia
+    (db.py escribe las de MySQL).
+  - product_search(words): el WHERE de la búsqueda de /products, sobre
+    product_summary (alias del llamador).
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Tuple
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ortomedica.db")
+
+class StorageBackend:
+    name = ""
+    # Sentencias propias del dialecto, por nombre (ver db._q)
+    sql: Dict[str, str] = {}
+    # LOAD DATA LOCAL INFILE
+    supports_infile = False
+    # money(v): redondeo de costo/precio antes de guardarlos, si la BD no lo hace
+    # sola (MySQL: DECIMAL(16,2) redondea al guardar)
+    money = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def ensure_schema(self, cur) -> bool:
+        """Crea las tablas si el backend trae su propio esquema (False: lo hace db.py)."""
+        return False
+
+    def max_statement_bytes(self, cur) -> int:
+        raise NotImplementedError
+
+    def max_params(self) -> int:
+        # Parámetros por sentencia (INSERT multi-fila)
+        return 65535
+
+    def product_search(self, words: List[str], alias: str = "ps") -> Tuple[str, Dict[str, str]]:
+        """
+        Condición SQL (sin WHERE) para que cada palabra aparezca en el sku o en
+        alguno de los nombres del SKU (names), y sus parámetros con nombre.
+        LIKE '%palabra%' en ambos backends salvo que el backend tenga algo mejor.
+        """
+        conditions, params = [], {}
+        for idx, word in enumerate(words):
+            name = f"q_like_{idx}"
+            conditions.append(f"({alias}.sku LIKE %({name})s OR {alias}.names LIKE %({name})s)")
+            params[name] = f"%{word}%"
+        return " AND ".join(conditions), params
+
+# -------------------- MySQL --------------------
+
+class MySQLBackend(StorageBackend):
+    """Pool de mysql-connector (se crea con la primera conexión)."""
+
+    name = "mysql"
+    supports_infile = True
+
+    def __init__(self, cfg: dict, pool_name: str = "ortomedica_pool", pool_size: int = 5):
+        self.cfg = cfg
+        self.pool_name = pool_name
+        self.pool_size = pool_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self._ngram = None
+
+    def connect(self):
+        if self._pool is None:
+            from mysql.connector import pooling
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pooling.MySQLConnectionPool(
+                        pool_name=self.pool_name, pool_size=self.pool_size, **self.cfg)
+        return self._pool.get_connection()
+
+    def max_statement_bytes(self, cur) -> int:
+        cur.execute("SELECT @@max_allowed_packet")
+        return int(cur.fetchone()[0])
+
+    def ngram_token_size(self) -> int:
+        """Largo de los n-gramas del índice FULLTEXT (variable del servidor, se lee una vez)."""
+        if self._ngram is None:
+            con = self.connect()
+            try:
+                cur = con.cursor()
+                cur.execute("SELECT @@ngram_token_size")
+                self._ngram = int(cur.fetchone()[0])
+                cur.close()
+            finally:
+                con.close()
+        return self._ngram
+
+    def product_search(self, words: List[str], alias: str = "ps") -> Tuple[str, Dict[str, str]]:
+        """
+        Índice FULLTEXT ngram ft_summary_sku_names (db.ensure_tables): cada
+        palabra va como frase obligatoria (+"palabra"), que con ngram equivale
+        a buscarla como subcadena, igual que el LIKE. Las palabras más cortas
+        que ngram_token_size no están en el índice y van con LIKE.
+        """
+        size = self.ngram_token_size()
+        # Dentro de una frase no hay forma de escapar la comilla: se quita
+        phrases = [w.replace('"', "") for w in words]
+        indexed = [p for p in phrases if len(p) >= size]
+        conditions, params = [], {}
+        if indexed:
+            conditions.append(f"MATCH({alias}.sku, {alias}.names) AGAINST (%(q_ft)s IN BOOLEAN MODE)")
+            params["q_ft"] = " ".join(f'+"{p}"' for p in indexed)
+        short_sql, short_params = super().product_search(
+            [w for w, p in zip(words, phrases) if len(p) < size], alias)
+        if short_sql:
+            conditions.append(short_sql)
+            params.update(short_params)
+        return " AND ".join(conditions), params
+
+# -------------------- SQLite --------------------
+
+# Decimal y fechas como en MySQL: DECIMAL vuelve como Decimal (el modo delta
+# compara contra Decimal) y TIMESTAMP como datetime
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime, lambda v: v.isoformat(" ", timespec="seconds"))
+sqlite3.register_converter("DECIMAL", lambda b: Decimal(b.decode()))
+sqlite3.register_converter("TIMESTAMP", lambda b: datetime.fromisoformat(b.decode()))
+
+# %(nombre)s → :nombre y %s → ? (paramstyle de sqlite3)
+_NAMED_PARAM = re.compile(r"%\((\w+)\)s")
+
+def _to_qmark(sql: str) -> str:
+    return _NAMED_PARAM.sub(r":\1", sql).replace("%s", "?")
+
+class _SQLiteCursor:
+    """Cursor de sqlite3 con la interfaz de mysql-connector que usa el código."""
+
+    def __init__(self, cur: sqlite3.Cursor, dictionary: bool = False):
+        self._cur = cur
+        self._dictionary = dictionary
+
+    def execute(self, sql: str, params=()):
+        self._cur.execute(_to_qmark(sql), params)
+        return self
+
+    def executemany(self, sql: str, seq):
+        self._cur.executemany(_to_qmark(sql), seq)
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((d[0] for d in self._cur.description), row))
+
+    def fetchone(self):
+        return self._row(self._cur.fetchone())
+
+    def fetchmany(self, size: int = None):
+        rows = self._cur.fetchmany(size) if size else self._cur.fetchmany()
+        return [self._row(r) for r in rows]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cur.fetchall()]
+
+    def __iter__(self):
+        return (self._row(r) for r in self._cur)
+
+    @property
+    def rowcount(self) -> int:
+        return self._cur.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cur.lastrowid
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    def close(self):
+        self._cur.close()
+
+class _SQLiteConnection:
+    def __init__(self, con: sqlite3.Connection):
+        self._con = con
+
+    def cursor(self, dictionary: bool = False, **kwargs):
+        return _SQLiteCursor(self._con.cursor(), dictionary)
+
+    def commit(self):
+        self._con.commit()
+
+    def rollback(self):
+        self._con.rollback()
+
+    def close(self):
+        self._con.close()
+
+    def ping(self, **kwargs):
+        pass
+
+# Tokenizer del índice FTS5. trigram distingue tildes (a diferencia de la
+# collation _ai_ci de MySQL y de search_index.normalize); remove_diacritics
+# para trigram existe desde SQLite 3.45. En versiones anteriores "ortopedica"
+# no encuentra "ortopédica" con SEARCH_INDEX=0 (el índice en memoria sí).
+_FTS_TOKENIZE = "trigram remove_diacritics 1" if sqlite3.sqlite_version_info >= (3, 45) else "trigram"
+_FTS_OPTIONS = f"sku, names, content='product_summary', content_rowid='rowid', tokenize='{_FTS_TOKENIZE}'"
+
+# Mismo esquema que db.ensure_tables() (MySQL). Los índices van aparte;
+# (name, sku) de product_summary es el del keyset de /products.
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+      email VARCHAR(255) PRIMARY KEY,
+      name VARCHAR(255) NOT NULL,
+      role VARCHAR(50) NOT NULL DEFAULT 'user',
+      password_hash VARCHAR(255) NOT NULL,
+      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stores (
+      id INT PRIMARY KEY,
+      name VARCHAR(200) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_assets (
+      sku VARCHAR(100) PRIMARY KEY,
+      image_url VARCHAR(1000) NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inventory_raw (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      system_code VARCHAR(40) NOT NULL,
+      store_id INT NOT NULL,
+      system_id VARCHAR(100) NULL,
+      sku VARCHAR(100) NULL,
+      name VARCHAR(500) NULL,
+      existencia INT NULL,
+      costo DECIMAL(16,2) NULL,
+      precio DECIMAL(16,2) NULL,
+      created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_raw_store ON inventory_raw (system_code, store_id)",
+    "CREATE INDEX IF NOT EXISTS idx_raw_system_id ON inventory_raw (system_id)",
+    "CREATE INDEX IF NOT EXISTS idx_raw_sku ON inventory_raw (sku)",
+    """
+    CREATE TABLE IF NOT EXISTS inventory_current (
+      system_code VARCHAR(40) NOT NULL,
+      store_id INT NOT NULL,
+      system_id VARCHAR(100) NOT NULL,
+      sku VARCHAR(100) NULL,
+      name VARCHAR(500) NULL,
+      existencia INT NULL,
+      costo DECIMAL(16,2) NULL,
+      precio DECIMAL(16,2) NULL,
+      last_seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      run_id BIGINT NOT NULL DEFAULT 0,
+      PRIMARY KEY (system_code, store_id, system_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_current_sku ON inventory_current (sku)",
+    "CREATE INDEX IF NOT EXISTS idx_current_run ON inventory_current (system_code, store_id, run_id)",
+    # El orden, el keyset y la búsqueda de /products pasaron a product_summary
+    "DROP INDEX IF EXISTS idx_current_name_sku",
+    "DROP TRIGGER IF EXISTS inventory_current_fts_ins",
+    "DROP TRIGGER IF EXISTS inventory_current_fts_del",
+    "DROP TRIGGER IF EXISTS inventory_current_fts_upd",
+    "DROP TABLE IF EXISTS inventory_current_fts",
+    """
+    CREATE TABLE IF NOT EXISTS product_summary (
+      sku VARCHAR(100) NOT NULL PRIMARY KEY,
+      name VARCHAR(500) NOT NULL DEFAULT '',
+      names TEXT NULL,
+      image_url VARCHAR(1000) NULL,
+      total_stock INT NULL,
+      min_price DECIMAL(16,2) NULL,
+      max_price DECIMAL(16,2) NULL,
+      store_count INT NOT NULL DEFAULT 0,
+      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_summary_name_sku ON product_summary (name, sku)",
+    # Búsqueda de /products: trigram encuentra subcadenas (como LIKE '%x%') de 3+
+    # caracteres en el sku y en todos los nombres del SKU. Contenido externo: el
+    # texto vive en product_summary y los triggers mantienen el índice (solo
+    # cuando cambian sku o names)
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS product_summary_fts USING fts5({_FTS_OPTIONS})",
+    """
+    CREATE TRIGGER IF NOT EXISTS product_summary_fts_ins AFTER INSERT ON product_summary BEGIN
+      INSERT INTO product_summary_fts (rowid, sku, names) VALUES (new.rowid, new.sku, new.names);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_summary_fts_del AFTER DELETE ON product_summary BEGIN
+      INSERT INTO product_summary_fts (product_summary_fts, rowid, sku, names)
+      VALUES ('delete', old.rowid, old.sku, old.names);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_summary_fts_upd AFTER UPDATE OF sku, names ON product_summary
+      WHEN old.sku IS NOT new.sku OR old.names IS NOT new.names BEGIN
+      INSERT INTO product_summary_fts (product_summary_fts, rowid, sku, names)
+      VALUES ('delete', old.rowid, old.sku, old.names);
+      INSERT INTO product_summary_fts (rowid, sku, names) VALUES (new.rowid, new.sku, new.names);
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS inventory_history (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      run_id BIGINT NOT NULL,
+      system_code VARCHAR(40) NOT NULL,
+      store_id INT NOT NULL,
+      system_id VARCHAR(100) NOT NULL,
+      sku VARCHAR(100) NULL,
+      name VARCHAR(500) NULL,
+      existencia INT NULL,
+      costo DECIMAL(16,2) NULL,
+      precio DECIMAL(16,2) NULL,
+      change_type VARCHAR(10) NOT NULL,
+      recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_history_item ON inventory_history (system_code, store_id, system_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_history_run ON inventory_history (run_id)",
+    """
+    CREATE TABLE IF NOT EXISTS ingestion_runs (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      system_code VARCHAR(40) NOT NULL,
+      store_id INT NOT NULL,
+      mode VARCHAR(20) NULL,
+      content_hash CHAR(64) NULL,
+      status VARCHAR(20) NOT NULL DEFAULT 'running',
+      row_count INT NULL,
+      swept INT NULL,
+      error VARCHAR(1000) NULL,
+      started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      finished_at TIMESTAMP NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_runs_store ON ingestion_runs (system_code, store_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_runs_status ON ingestion_runs (status, id)",
+    """
+    CREATE TABLE IF NOT EXISTS inventory_current_staging (
+      system_code VARCHAR(40) NOT NULL,
+      store_id INT NOT NULL,
+      system_id VARCHAR(100) NOT NULL,
+      sku VARCHAR(100) NULL,
+      name VARCHAR(500) NULL,
+      existencia INT NULL,
+      costo DECIMAL(16,2) NULL,
+      precio DECIMAL(16,2) NULL,
+      PRIMARY KEY (system_code, store_id, system_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ingest_export_cache (
+      system_code VARCHAR(40) NOT NULL,
+      store_id INT NOT NULL,
+      content_hash CHAR(64) NOT NULL,
+      row_count INT NOT NULL DEFAULT 0,
+      updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (system_code, store_id)
+    )
+    """,
+]
+
+# Comparación que trata NULL como valor (el <=> de MySQL es IS en SQLite)
+_SQLITE_DIFFERS = """NOT (c.sku IS s.sku AND c.name IS s.name AND c.existencia IS s.existencia
+                AND c.costo IS s.costo AND c.precio IS s.precio)"""
+
+_SQLITE_SQL = {
+    "ENSURE_STORE": "INSERT OR IGNORE INTO stores (id, name) VALUES (%s, %s)",
+    "UPSERT_INVENTORY_CURRENT": """
+        INSERT INTO inventory_current
+          (system_code, store_id, system_id, sku, name, existencia, costo, precio, last_seen_at)
+        VALUES
+          (%(system_code)s, %(store_id)s, %(system_id)s, %(sku)s, %(name)s,
+           %(existencia)s, %(costo)s, %(precio)s, COALESCE(%(seen_at)s, CURRENT_TIMESTAMP))
+        ON CONFLICT (system_code, store_id, system_id) DO UPDATE SET
+           sku=excluded.sku,
+           name=excluded.name,
+           existencia=excluded.existencia,
+           costo=excluded.costo,
+           precio=excluded.precio,
+           last_seen_at=excluded.last_seen_at
+    """,
+    "UPSERT_CURRENT": """
+        INSERT INTO inventory_current
+            (system_code, store_id, system_id, sku, name, existencia, costo, precio, last_seen_at, run_id)
+        VALUES {values}
+        ON CONFLICT (system_code, store_id, system_id) DO UPDATE SET
+             sku=excluded.sku,
+             name=excluded.name,
+             existencia=excluded.existencia,
+             costo=excluded.costo,
+             precio=excluded.precio,
+             last_seen_at=excluded.last_seen_at,
+             run_id=excluded.run_id
+    """,
+    "UPSERT_STAGING": """
+        INSERT INTO inventory_current_staging
+            (system_code, store_id, system_id, sku, name, existencia, costo, precio)
+        VALUES {values}
+        ON CONFLICT (system_code, store_id, system_id) DO UPDATE SET
+             sku=excluded.sku,
+             name=excluded.name,
+             existencia=excluded.existencia,
+             costo=excluded.costo,
+             precio=excluded.precio
+    """,
+    "PUBLISH_DELETE": """
+        DELETE FROM inventory_current
+         WHERE system_code=%s AND store_id=%s
+           AND NOT EXISTS (SELECT 1 FROM inventory_current_staging s
+                            WHERE s.system_code=inventory_current.system_code
+                              AND s.store_id=inventory_current.store_id
+                              AND s.system_id=inventory_current.system_id)
+    """,
+    "PUBLISH_UPDATE": f"""
+        UPDATE inventory_current AS c
+           SET sku=s.sku, name=s.name, existencia=s.existencia, costo=s.costo, precio=s.precio,
+               run_id=%s
+          FROM inventory_current_staging AS s
+         WHERE s.system_code=c.system_code AND s.store_id=c.store_id AND s.system_id=c.system_id
+           AND c.system_code=%s AND c.store_id=%s
+           AND {_SQLITE_DIFFERS}
+    """,
+    "HISTORY_FROM_STAGING": f"""
+        INSERT INTO inventory_history
+            (system_code, store_id, system_id, sku, name, existencia, costo, precio, change_type, run_id)
+        SELECT s.system_code, s.store_id, s.system_id, s.sku, s.name, s.existencia, s.costo, s.precio,
+               CASE WHEN c.system_id IS NULL THEN 'new' ELSE 'changed' END, %s
+          FROM inventory_current_staging s
+          LEFT JOIN inventory_current c
+            ON c.system_code=s.system_code AND c.store_id=s.store_id AND c.system_id=s.system_id
+         WHERE s.system_code=%s AND s.store_id=%s
+           AND (c.system_id IS NULL OR {_SQLITE_DIFFERS})
+    """,
+    # group_concat(DISTINCT ...) no acepta separador: cada nombre lleva su salto
+    # de línea y se quitan las comas que agrega entre ellos
+    "UPSERT_SUMMARY": """
+        INSERT INTO product_summary
+            (sku, name, names, image_url, total_stock, min_price, max_price, store_count, updated_at)
+        SELECT i.sku, COALESCE(MIN(i.name), ''),
+               REPLACE(group_concat(DISTINCT i.name || char(10)), char(10) || ',', char(10)),
+               MAX(pa.image_url), SUM(i.existencia),
+               MIN(i.precio), MAX(i.precio), COUNT(DISTINCT i.store_id), CURRENT_TIMESTAMP
+          FROM inventory_current i
+          LEFT JOIN product_assets pa ON pa.sku = i.sku
+         WHERE i.sku IS NOT NULL {where}
+         GROUP BY i.sku
+        ON CONFLICT (sku) DO UPDATE SET
+             name=excluded.name,
+             names=excluded.names,
+             image_url=excluded.image_url,
+             total_stock=excluded.total_stock,
+             min_price=excluded.min_price,
+             max_price=excluded.max_price,
+             store_count=excluded.store_count,
+             updated_at=excluded.updated_at
+    """,
+    "SAVE_EXPORT_HASH": """
+        INSERT INTO ingest_export_cache (system_code, store_id, content_hash, row_count)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (system_code, store_id) DO UPDATE SET
+           content_hash=excluded.content_hash,
+           row_count=excluded.row_count,
+           updated_at=CURRENT_TIMESTAMP
+    """,
+}
+
+def _fts_phrase(word: str) -> str:
+    # Frase FTS5 literal: las comillas se duplican y nada se interpreta como operador
+    return '"' + word.replace('"', '""') + '"'
+
+_CENT = Decimal("0.01")
+
+class SQLiteBackend(StorageBackend):
+    """Archivo SQLite en modo WAL; una conexión por _con()/connect() (abrirla cuesta microsegundos)."""
+
+    name = "sqlite"
+    sql = _SQLITE_SQL
+
+    @staticmethod
+    def money(v):
+        # DECIMAL(16,2) en SQLite no tiene escala: 1234.567 quedaría tal cual y
+        # el modo delta lo vería distinto de lo que guarda MySQL (1234.57) en
+        # cada corrida. Mismo redondeo que MySQL (mitad hacia afuera)
+        if v is None:
+            return None
+        return (v if isinstance(v, Decimal) else Decimal(repr(v))).quantize(_CENT, rounding=ROUND_HALF_UP)
+
+    def __init__(self, path: str = None, timeout: float = 30.0):
+        self.path = path or DEFAULT_SQLITE_PATH
+        self.timeout = timeout
+        self._wal_ready = False
+
+    def connect(self):
+        con = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False,
+                              detect_types=sqlite3.PARSE_DECLTYPES)
+        if not self._wal_ready:
+            # journal_mode=WAL queda guardado en el archivo: basta una vez
+            con.execute("PRAGMA journal_mode=WAL")
+            self._wal_ready = True
+        con.execute("PRAGMA synchronous=NORMAL")
+        return _SQLiteConnection(con)
+
+    def ensure_schema(self, cur) -> bool:
+        # Un índice creado con otras columnas u otro tokenizer (p. ej. antes de
+        # actualizar SQLite) se vuelve a crear, con sus triggers, y se rellena
+        # desde product_summary
+        cur.execute("SELECT sql FROM sqlite_master WHERE name = 'product_summary_fts'")
+        row = cur.fetchone()
+        rebuild = row is not None and _FTS_OPTIONS not in row[0]
+        if rebuild:
+            for trigger in ("ins", "del", "upd"):
+                cur.execute(f"DROP TRIGGER IF EXISTS product_summary_fts_{trigger}")
+            cur.execute("DROP TABLE product_summary_fts")
+        # product_summary de antes de names: se vacía y db._ensure_product_summary
+        # la vuelve a armar completa
+        cur.execute("PRAGMA table_info(product_summary)")
+        columns = {r[1] for r in cur.fetchall()}
+        if columns and "names" not in columns:
+            cur.execute("ALTER TABLE product_summary ADD COLUMN names TEXT NULL")
+            cur.execute("DELETE FROM product_summary")
+        for stmt in SQLITE_SCHEMA:
+            cur.execute(stmt)
+        if rebuild:
+            cur.execute("INSERT INTO product_summary_fts (product_summary_fts) VALUES ('rebuild')")
+        return True
+
+    def max_statement_bytes(self, cur) -> int:
+        # SQLITE_MAX_SQL_LENGTH por defecto: 1 000 000 000
+        return 1_000_000_000
+
+    def max_params(self) -> int:
+        # SQLITE_MAX_VARIABLE_NUMBER: 32766 desde 3.32, 999 antes
+        return 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999
+
+    def product_search(self, words: List[str], alias: str = "ps") -> Tuple[str, Dict[str, str]]:
+        """
+        Palabras de 3+ caracteres: una sola consulta al índice FTS5 (todas con
+        AND). Las más cortas, que trigram no indexa, van con LIKE. Sin tildes
+        solo desde SQLite 3.45 (ver _FTS_TOKENIZE).
+        """
+        long_words = [w for w in words if len(w) >= 3]
+        conditions, params = [], {}
+        if long_words:
+            conditions.append(f"{alias}.rowid IN (SELECT rowid FROM product_summary_fts "
+                              f"WHERE product_summary_fts MATCH %(q_fts)s)")
+            params["q_fts"] = " AND ".join(_fts_phrase(w) for w in long_words)
+        short_sql, short_params = super().product_search([w for w in words if len(w) < 3], alias)
+        if short_sql:
+            conditions.append(short_sql)
+            params.update(short_params)
+        return " AND ".join(conditions), params
+
+# -------------------- Selección --------------------
+
+def backend_name() -> str:
+    return (os.getenv("DB_BACKEND") or "mysql").strip().lower()
+
+def get_backend(mysql_cfg: dict = None, **pool) -> StorageBackend:
+    """
+    Backend según DB_BACKEND. `mysql_cfg` y `pool` (pool_name, pool_size) solo
+    se usan con MySQL.
+    """
+    name = backend_name()
+    if name == "sqlite":
+        return SQLiteBackend(os.getenv("SQLITE_PATH") or None)
+    if name == "mysql":
+        return MySQLBackend(mysql_cfg or {}, **pool)
+    raise ValueError(f"DB_BACKEND inválido: {name!r} (usa mysql o sqlite)")
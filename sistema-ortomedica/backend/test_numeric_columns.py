@@ -0,0 +1,46 @@
+"""
+parse_price_column / to_int_loose_column deben dar exactamente lo mismo que
+parse_price / to_int_loose celda por celda, también con textos raros.
+
+    python -m pytest test_numeric_columns.py
+"""
+import random
+
+from utils import parse_price, to_int_loose, parse_price_column, to_int_loose_column
+
+EDGE = [
+    None, "", " ", "-", ".", ",", "-.", "-,", "--1", "1-", "1-2", "- 5",
+    ",-0.623", ".-4,4", ",-220.9", ".-1605,", "-,5", "-.5", "1,234.50", "1.234,50",
+    "-1.234,50", "₡-2,5", "$-18,750.00", "\xa0-3\xa0", "1,2,3", "1.2.3", "1.2,3,4",
+    "12345678901234567", "-0", "0,00", "١٢٣", 18750.0, -3.5, 7,
+]
+
+
+def _random_texts(n: int, seed: int):
+    alphabet = list("0123456789,.- $₡") + ["\xa0"]
+    rnd = random.Random(seed)
+    return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 8))) for _ in range(n)]
+
+
+def _same(a, b):
+    return (a is None and b is None) or (a == b and type(a) is type(b))
+
+
+def _int_or_error(fn, v):
+    try:
+        return fn(v)
+    except ValueError as e:
+        return type(e)
+
+
+def test_parse_price_column_matches_scalar():
+    values = EDGE + _random_texts(20000, seed=1)
+    for v, got in zip(values, parse_price_column(values)):
+        assert _same(got, parse_price(v)), repr(v)
+
+
+def test_to_int_loose_column_matches_scalar():
+    # Una celda por llamada: la versión escalar lanza ValueError con algunos textos
+    for v in EDGE + _random_texts(3000, seed=2):
+        got = _int_or_error(lambda x: to_int_loose_column([x])[0], v)
+        assert _same(got, _int_or_error(to_int_loose, v)), repr(v)
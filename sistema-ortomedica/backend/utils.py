@@ -1,5 +1,7 @@
 import re
-from typing import Optional
+from typing import List, Optional, Sequence
+
+import numpy as np
 
 def parse_price(s: Optional[str]) -> Optional[float]:
     if s is None: return None
@@ -27,3 +29,119 @@ def to_int_loose(s: Optional[str]) -> int:
 
 def txt(s: Optional[str]) -> str:
     return (str(s).strip() if s else "")
+
+# ---------------------------------------------------------------------
+# Conversión por columnas: mismo resultado que parse_price / to_int_loose,
+# pero sobre un lote completo con operaciones de NumPy (sin regex por celda).
+# La columna se ve como una matriz de códigos Unicode y se recorre por
+# posición de carácter: cada paso procesa esa posición de todas las celdas a
+# la vez y el número se arma por Horner (m = m*10 + dígito). Las celdas raras
+# (dígitos no ASCII, más de 15 cifras) usan la función escalar.
+# ---------------------------------------------------------------------
+
+# Caracteres no ASCII que suelen venir pegados al número (la regex los descarta)
+_NOISE = np.array([ord(c) for c in "\xa0₡¢€"], dtype=np.uint32)
+_MAX_DIGITS = 15  # < 2**53: mantisa exacta en float64
+_ZERO, _NINE, _COMMA, _DOT, _MINUS = (ord(c) for c in "09,.-")
+
+_POW10 = 10 ** np.arange(_MAX_DIGITS + 1, dtype=np.int64)
+
+def _last(mask: np.ndarray) -> np.ndarray:
+    # Posición de la última coincidencia por celda (-1 si no hay)
+    w = mask.shape[1]
+    return np.where(mask.any(axis=1), w - 1 - np.argmax(mask[:, ::-1], axis=1), -1)
+
+class _Scan:
+    """
+    Resumen por celda (una fila de la matriz por celda) de una columna de texto
+    numérico. Solo se analizan los textos distintos: en un export las columnas
+    repiten mucho (existencias chicas, precios iguales) y `inverse` lleva cada
+    celda a su valor único.
+    """
+
+    def __init__(self, values: Sequence):
+        texts = np.array(["" if v is None else str(v) for v in values], dtype=str)
+        arr, self.inverse = np.unique(texts, return_inverse=True)
+        self.texts = arr.tolist()
+        n = len(arr)
+        w = arr.itemsize // 4
+        codes = arr.view(np.uint32).reshape(n, w)
+        rows = np.arange(n)
+
+        digit = (codes >= _ZERO) & (codes <= _NINE)
+        comma, dot, minus = codes == _COMMA, codes == _DOT, codes == _MINUS
+
+        # suffix[:, j] = dígitos en las posiciones >= j (columna extra en 0 al final)
+        suffix = np.zeros((n, w + 1), dtype=np.int64)
+        np.cumsum(digit[:, ::-1], axis=1, out=suffix[:, w - 1::-1])
+        self.ndig = suffix[:, 0]
+
+        # Todos los dígitos como un entero: cada dígito pesa 10**(dígitos a su derecha)
+        weight = _POW10[np.minimum(suffix[:, 1:], _MAX_DIGITS)]
+        self.m = np.where(digit, (codes - _ZERO).astype(np.int64) * weight, 0).sum(axis=1)
+
+        self.n_comma = np.count_nonzero(comma, axis=1)
+        self.n_dot = np.count_nonzero(dot, axis=1)
+        self.n_minus = np.count_nonzero(minus, axis=1)
+        self.last_comma, self.last_dot = _last(comma), _last(dot)
+        # Dígitos después de la última coma / punto
+        self.after_comma = suffix[rows, self.last_comma + 1]
+        self.after_dot = suffix[rows, self.last_dot + 1]
+        # El primer carácter que llega a float() es "-". parse_price borra el
+        # separador de miles cuando vienen los dos (",-1.5" → "-1.5"), así que
+        # solo cuentan los dígitos, el "-" y el separador decimal
+        both = (self.n_comma > 0) & (self.n_dot > 0)
+        comma_dec = (self.last_comma > self.last_dot)[:, None]
+        kept = digit | minus | (comma & (comma_dec | ~both[:, None])) | (dot & (~comma_dec | ~both[:, None]))
+        first = np.argmax(kept, axis=1)
+        self.lead_minus = minus[rows, first]
+
+        # Filas con caracteres no ASCII desconocidos (podrían ser dígitos Unicode)
+        high = codes >= 128
+        if high.any():
+            self.odd = (high & ~np.isin(codes, _NOISE)).any(axis=1)
+        else:
+            self.odd = np.zeros(n, dtype=bool)
+
+def parse_price_column(values: Sequence) -> List[Optional[float]]:
+    """
+    parse_price() para una columna completa. El separador decimal sale de la
+    última coma/punto de cada celda (1.234,50 / 1,234.50 / 1234,50) y el otro
+    se toma como separador de miles, igual que en la versión escalar.
+    """
+    if not len(values):
+        return []
+    sc = _Scan(values)
+    comma_dec = sc.last_comma > sc.last_dot
+    k = np.where(comma_dec, sc.after_comma, np.where(sc.last_dot >= 0, sc.after_dot, 0))
+    n_sep = np.where(comma_dec, sc.n_comma, sc.n_dot)
+
+    # Lo que float() acepta: "-" solo al inicio, un separador decimal y algún dígito
+    valid = (sc.ndig > 0) & (n_sep <= 1) & ((sc.n_minus == 0) | ((sc.n_minus == 1) & sc.lead_minus))
+    fast = valid & ~sc.odd & (sc.ndig <= _MAX_DIGITS)
+    val = sc.m / 10.0 ** k  # M y 10**k exactos: la división redondea igual que float(str)
+    val = np.where(sc.n_minus > 0, -val, val)
+
+    out = np.full(len(sc.texts), None, dtype=object)
+    out[fast] = val[fast]
+    for i in np.flatnonzero(sc.odd | (valid & ~fast)).tolist():
+        out[i] = parse_price(sc.texts[i])
+    return out[sc.inverse].tolist()
+
+def to_int_loose_column(values: Sequence) -> List[int]:
+    """
+    to_int_loose() para una columna completa: "." es separador de miles y ","
+    decimal, igual que la versión escalar.
+    """
+    if not len(values):
+        return []
+    sc = _Scan(values)
+    k = np.where(sc.last_comma >= 0, sc.after_comma, 0)
+    empty = (sc.ndig == 0) & (sc.n_comma == 0) & ~sc.odd
+    fast = (sc.ndig > 0) & (sc.n_comma <= 1) & (sc.ndig <= _MAX_DIGITS) & ~sc.odd
+
+    out = np.zeros(len(sc.texts), dtype=object)
+    out[fast] = np.trunc(sc.m / 10.0 ** k)[fast].astype(np.int64)
+    for i in np.flatnonzero(~empty & ~fast).tolist():
+        out[i] = to_int_loose(sc.texts[i])  # mismo resultado (o el mismo error) que la versión escalar
+    return out[sc.inverse].tolist()